@@ -0,0 +1,60 @@
+"""Benchmark extracting data frames from large rendered charts.
+
+Compares :func:`pytrevl.charts.extract_chart_dataframe` with the previous
+implementation that built one data frame per series and concatenated them.
+
+Usage::
+
+    python benchmarks/bench_extract.py [--series 20] [--points 5000]
+"""
+import argparse
+from timeit import repeat
+
+import pandas as pd
+
+from pytrevl.charts import extract_chart_dataframe
+
+from synthetic import rendered_heatmap
+
+
+def extract_dataframe_per_series(series, rendered_chart):
+    """The previous implementation, for comparison."""
+    df = pd.DataFrame.from_records(series["data"])
+    if "name" in series:
+        df["series_name"] = series["name"]
+    if "stack" in series:
+        df["stack"] = series["stack"]
+    if "xAxis" in rendered_chart:
+        m = dict(enumerate(rendered_chart["xAxis"]["categories"]))
+        df["x"] = df["x"].map(m)
+    if "yAxis" in rendered_chart:
+        m = dict(enumerate(rendered_chart["yAxis"]["categories"]))
+        df["y"] = df["y"].map(m)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--series', type=int, default=20)
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    chart = rendered_heatmap(args.series, args.points)
+
+    def per_series():
+        dfs = [extract_dataframe_per_series(s, chart) for s in chart['series']]
+        return pd.concat(dfs, ignore_index=True)
+
+    def columnar():
+        return extract_chart_dataframe(chart)
+
+    before = min(repeat(per_series, number=1, repeat=args.repeat))
+    after = min(repeat(columnar, number=1, repeat=args.repeat))
+    print(f'{args.series} series x {args.points} points')
+    print(f'per series: {before * 1000:8.1f} ms')
+    print(f'columnar:   {after * 1000:8.1f} ms ({before / after:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
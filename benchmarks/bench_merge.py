@@ -0,0 +1,80 @@
+"""Benchmark merging the display of components.
+
+Compares :func:`pytrevl.utils.merge` merging defaults, keyword arguments and
+custom settings in one pass with the previous implementation that merged
+them in two steps, deep-copying untouched subtrees each time.
+
+Usage::
+
+    python benchmarks/bench_merge.py [--components 300]
+"""
+import argparse
+from copy import deepcopy
+from itertools import zip_longest
+from timeit import repeat
+import tracemalloc
+
+from pytrevl.utils import merge
+
+from synthetic import display_layers
+
+
+def merge_two_step(a, b):
+    """The previous implementation, for comparison."""
+    if type(a) != type(b):
+        raise ValueError(f'Can only merge same typed objects. Got: {type(a)} and {type(b)}')
+    if isinstance(a, dict):
+        out = {}
+        for k in set(a) | set(b):
+            if k in a and k in b:
+                out[k] = merge_two_step(a[k], b[k])
+            elif k in a:
+                out[k] = deepcopy(a[k])
+            else:
+                out[k] = deepcopy(b[k])
+
+    elif isinstance(a, list):
+        out = []
+        for ai, bi in zip_longest(a, b):
+            if ai is not None and bi is not None:
+                out.append(merge_two_step(ai, bi))
+            elif ai is not None:
+                out.append(deepcopy(ai))
+            else:
+                out.append(deepcopy(bi))
+    else:
+        out = b
+
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--components', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    layers = [display_layers(i) for i in range(args.components)]
+
+    def two_step():
+        return [merge_two_step(merge_two_step(d, k), c) for d, k, c in layers]
+
+    def one_pass():
+        return [merge(d, k, c) for d, k, c in layers]
+
+    assert two_step() == one_pass()
+    print(f'{args.components} components')
+    results = {}
+    for name, func in (('two step', two_step), ('one pass', one_pass)):
+        elapsed = min(repeat(func, number=1, repeat=args.repeat))
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = elapsed
+        print(f'{name}: {elapsed * 1000:8.1f} ms, peak {peak / 2**20:6.2f} MiB')
+    print(f'one pass is {results["two step"] / results["one pass"]:.1f}x faster')
+
+
+if __name__ == '__main__':
+    main()
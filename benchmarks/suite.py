@@ -0,0 +1,218 @@
+"""Benchmark suite for serialization and data extraction.
+
+Times the hot paths of pytrevl on synthetic data (see :mod:`synthetic`) and
+records the peak memory allocated by each of them. Results can be stored as
+JSON and later runs compared against them::
+
+    python benchmarks/suite.py --output baseline.json
+    # ... change something ...
+    python benchmarks/suite.py --baseline baseline.json
+
+When comparing, benchmarks slower or using more memory than ``--threshold``
+times the baseline are flagged and the exit status is 1.
+"""
+import argparse
+import json
+import platform
+import re
+import sys
+from timeit import Timer
+import tracemalloc
+
+import pytrevl
+from pytrevl.charts import extract_chart_dataframe
+from pytrevl.downsample import downsample_chart
+from pytrevl.notebook import render_chart, render_shared
+from pytrevl.utils import insert, merge, parse_path
+
+import synthetic
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark.
+
+    The decorated function receives the parsed command line arguments and
+    returns the function to measure.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+@benchmark('merge')
+def bench_merge(args):
+    layers = [synthetic.display_layers(i) for i in range(args.components)]
+    return lambda: [merge(d, k, c) for d, k, c in layers]
+
+
+@benchmark('insert')
+def bench_insert(args):
+    paths = [
+        (parse_path(path), value)
+        for path, value in synthetic.custom_paths(args.components * args.overrides, args.depth)
+    ]
+
+    def run():
+        container = {}
+        for path, value in paths:
+            insert(value, path, container)
+        return container
+    return run
+
+
+@benchmark('serialize')
+def bench_serialize(args):
+    """Serialize all components without memoization."""
+    dashboard = synthetic.large_dashboard(args.components, args.overrides, args.depth)
+
+    def run():
+        for comp in dashboard.components:
+            comp._invalidate()
+        return dashboard.serialize()
+    return run
+
+
+@benchmark('serialize_cached')
+def bench_serialize_cached(args):
+    dashboard = synthetic.large_dashboard(args.components, args.overrides, args.depth)
+    dashboard.serialize()
+    return dashboard.serialize
+
+
+@benchmark('as_json')
+def bench_as_json(args):
+    dashboard = synthetic.large_dashboard(args.components, args.overrides, args.depth)
+    return dashboard.as_json
+
+
+@benchmark('as_yaml')
+def bench_as_yaml(args):
+    dashboard = synthetic.large_dashboard(args.components, args.overrides, args.depth)
+    return dashboard.as_yaml
+
+
+@benchmark('extract_dataframe')
+def bench_extract(args):
+    chart = synthetic.rendered_heatmap(args.series, args.points)
+    return lambda: extract_chart_dataframe(chart)
+
+
+@benchmark('extract_dataframe_arrays')
+def bench_extract_arrays(args):
+    chart = synthetic.rendered_line_chart(args.series, args.points)
+    return lambda: extract_chart_dataframe(chart)
+
+
+@benchmark('render_chart')
+def bench_render_chart(args):
+    chart = synthetic.rendered_line_chart(args.series, args.points)
+    return lambda: render_chart(chart)
+
+
+@benchmark('render_shared')
+def bench_render_shared(args):
+    charts = [synthetic.rendered_line_chart(1, args.points, seed=i) for i in range(args.series)]
+    return lambda: render_shared(charts)
+
+
+@benchmark('downsample')
+def bench_downsample(args):
+    chart = synthetic.rendered_line_chart(args.series, args.points)
+    return lambda: downsample_chart(chart, max_points=args.points // 10)
+
+
+def measure(func, repeats):
+    """The fastest of ``repeats`` runs in seconds and the peak memory in
+    bytes allocated by one run.
+
+    Fast functions are called several times per run to reduce noise.
+    """
+    timer = Timer(func)
+    number, _ = timer.autorange()
+    elapsed = min(timer.repeat(number=number, repeat=repeats)) / number
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'time': elapsed, 'peak_memory': peak}
+
+
+def run(args):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter and not re.search(args.filter, name):
+            continue
+        results[name] = measure(setup(args), args.repeat)
+        print(f'{name:<26} {results[name]["time"] * 1000:9.2f} ms  {results[name]["peak_memory"] / 2**20:8.2f} MiB')
+    return {
+        'meta': {
+            'pytrevl': pytrevl.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': {k: getattr(args, k) for k in ('components', 'overrides', 'depth', 'series', 'points')},
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Compare ``results`` with ``baseline``.
+
+    Returns
+    -------
+    regressions
+        Descriptions of the benchmarks whose time or peak memory grew by more
+        than a factor of ``threshold``.
+    """
+    if baseline['meta']['parameters'] != results['meta']['parameters']:
+        print('Warning: the baseline was run with different parameters', file=sys.stderr)
+
+    regressions = []
+    print(f'\n{"":<26} {"time":>9}  {"memory":>8}')
+    for name, current in results['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        ratios = {key: current[key] / previous[key] if previous[key] else 1.0 for key in ('time', 'peak_memory')}
+        flagged = [key for key, ratio in ratios.items() if ratio > threshold]
+        print(f'{name:<26} {ratios["time"]:8.2f}x  {ratios["peak_memory"]:7.2f}x  {"REGRESSION" if flagged else ""}')
+        regressions.extend(f'{name}: {key} {ratios[key]:.2f}x the baseline' for key in flagged)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--components', type=int, default=200, help='Components per dashboard')
+    parser.add_argument('--overrides', type=int, default=20, help='Custom settings per component')
+    parser.add_argument('--depth', type=int, default=6, help='Depth of the custom settings')
+    parser.add_argument('--series', type=int, default=20, help='Series per rendered chart')
+    parser.add_argument('--points', type=int, default=5000, help='Points per series')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', help='Only run benchmarks matching this regular expression')
+    parser.add_argument('--output', help='Store the results in this JSON file')
+    parser.add_argument('--baseline', help='Compare with the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=1.5, help='Ratio to the baseline flagged as regression')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\nRegressions:\n' + '\n'.join(f'- {r}' for r in regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
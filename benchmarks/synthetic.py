@@ -0,0 +1,107 @@
+"""Synthetic dashboards and rendered charts for the benchmarks.
+
+All generators are deterministic for a given ``seed``.
+"""
+import random
+
+from pytrevl import ColumnChart, CubeQuery, CustomChart, Dashboard, LineChart, ScoreComponent
+
+
+def display_layers(i):
+    """Default, keyword argument and custom display of the ``i``-th chart."""
+    default = {
+        'chart': {'type': 'line', 'zoomType': 'x', 'style': {'fontFamily': 'sans-serif'}},
+        'legend': {'enabled': True, 'align': 'right', 'items': [{'style': {'color': '#333'}} for _ in range(5)]},
+        'plotOptions': {'series': {'marker': {'enabled': False}, 'dataLabels': {'enabled': False}}},
+        'colors': [f'#{c:06x}' for c in range(0, 0xffffff, 0x111111)],
+        'xAxis': {'labels': {'rotation': -45}, 'title': {'text': None}},
+        'yAxis': {'labels': {'format': '{value}'}, 'title': {'text': None}},
+    }
+    kwargs = {
+        'title': {'text': f'Chart {i}'},
+        'series': [{'name': 'series', 'data': {'x': '$cube.dim', 'y': '$cube.measure'}}],
+    }
+    custom = {
+        'series': [{'color': '#ff0000'}],
+        'xAxis': {'labels': {'rotation': 0}},
+    }
+    return default, kwargs, custom
+
+
+def custom_paths(n_paths, depth, seed=0):
+    """Dot-separated paths with values for deep ``custom`` overrides."""
+    rnd = random.Random(seed)
+    keys = ['chart', 'plotOptions', 'xAxis', 'yAxis', 'legend', 'tooltip', 'style', 'labels']
+    paths = []
+    for i in range(n_paths):
+        parts = [rnd.choice(keys)]
+        for level in range(1, depth):
+            parts.append(str(rnd.randrange(3)) if level % 3 == 2 else rnd.choice(keys))
+        parts.append(f'option{i}')
+        paths.append(('.'.join(parts), rnd.random()))
+    return paths
+
+
+def large_dashboard(n_components=200, n_overrides=20, depth=6, seed=0):
+    """A dashboard of line, column, score and custom components with
+    ``n_overrides`` custom settings of ``depth`` levels each."""
+    components = []
+    for i in range(n_components):
+        query = CubeQuery(
+            f'cube{i % 10}',
+            measures=['count', 'total'],
+            dimensions=['region', 'year'],
+            filters=[],
+        )
+        kind = i % 4
+        if kind == 0:
+            comp = LineChart(query, id=f'line-{i}', title=f'Line {i}')
+        elif kind == 1:
+            comp = ColumnChart(query, id=f'column-{i}', title=f'Column {i}', category=query['region'])
+        elif kind == 2:
+            comp = ScoreComponent(query, id=f'score-{i}', unit='%', digits=1)
+        else:
+            comp = CustomChart(
+                {'type': 'chart', 'id': f'custom-{i}', 'display': {'chart': {'type': 'area'}}, 'queries': [query.serialize()]},
+            )
+        if kind != 3:
+            for path, value in custom_paths(n_overrides, depth, seed=seed + i):
+                comp[path] = value
+        components.append(comp)
+    return Dashboard(f'Synthetic dashboard with {n_components} components', components)
+
+
+def rendered_heatmap(n_series, n_points, seed=0):
+    """A rendered heatmap chart with categorical axes."""
+    rnd = random.Random(seed)
+    n_categories = 100
+    return {
+        'type': 'chart',
+        'chart': {'type': 'heatmap'},
+        'xAxis': {'categories': [f'x-{i}' for i in range(n_categories)]},
+        'yAxis': {'categories': [f'y-{i}' for i in range(n_categories)]},
+        'series': [
+            {
+                'name': f'series-{s}',
+                'stack': f'stack-{s % 3}',
+                'data': [
+                    {'x': rnd.randrange(n_categories), 'y': rnd.randrange(n_categories), 'value': rnd.random()}
+                    for _ in range(n_points)
+                ],
+            }
+            for s in range(n_series)
+        ],
+    }
+
+
+def rendered_line_chart(n_series, n_points, seed=0):
+    """A rendered line chart with ``[x, y]`` points."""
+    rnd = random.Random(seed)
+    return {
+        'type': 'chart',
+        'chart': {'type': 'line'},
+        'series': [
+            {'name': f'series-{s}', 'data': [[x, rnd.gauss(0, 1)] for x in range(n_points)]}
+            for s in range(n_series)
+        ],
+    }
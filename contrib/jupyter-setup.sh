@@ -6,7 +6,7 @@ set -x
 echo "Running PyTrevl jupyter-lab setup..."
 
 # Install runtime dependencies
-pip install "CubeJsClient>=0.1.1,<0.2"
+pip install "PyJWT>=2.0"
 
 # Install dev dependencies
 conda install "pytest>=7.2,<8"
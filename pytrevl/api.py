@@ -1,30 +1,223 @@
 """Wrapper around x-middle API."""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextvars import copy_context
+from copy import deepcopy
+from dataclasses import dataclass
+import gzip
+import hashlib
 from json import dumps
 from os import environ
 from posixpath import join as url_join
-from typing import Optional, TYPE_CHECKING
-from cube_js_client import CubeJsClient
+from time import monotonic, perf_counter, sleep, time
+from typing import Iterable, Iterator, Optional, TYPE_CHECKING
 
-import requests
+from .cache import LRUCache
+from .hedging import DeadlineExceeded, HedgePolicy, LatencyHistogram, Timeout, cap_timeout, deadline_at, remaining
+from .instrument import current_span, span
+from .registry import ClientRegistry
+from .utils import content_hash, json_dumpb
 
 if TYPE_CHECKING:
+    import requests
     from .dashboard import Dashboard
 
 
-_xmiddle = None
-_cube = None
+def configure_session(session: 'requests.Session', pool_size: int=10, retries: int=2, backoff_factor: float=0.5, retry_methods: Iterable[str]=('GET',)):
+    """Configure connection pooling and retries of a :class:`requests.Session`.
 
-def cube(server: str="CUBE_SERVER", secret: str="CUBE_SECRET"):
-    global _cube
-    if not _cube:
-        _cube = CubeJsClient(server=environ[server], secret=environ[secret])
-    return _cube
+    Parameters
+    ----------
+    session
+        The session to configure.
+    pool_size
+        The maximum number of connections kept alive per host. Should be at
+        least the number of threads using ``session`` concurrently.
+    retries
+        How often failed connections, and requests of ``retry_methods``
+        failing while reading or answered with a 5xx status, are retried.
+    backoff_factor
+        Retries wait ``backoff_factor * 2 ** (retry - 1)`` seconds.
+    retry_methods
+        The HTTP methods retried after the request was sent. ``POST``
+        requests are only retried if connecting fails, since
+        :class:`XMiddleService` already sends duplicates of slow renders
+        (see :class:`~pytrevl.hedging.HedgePolicy`) and retrying them as
+        well would multiply the load on a struggling server.
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(retry_methods),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+class CubeError(Exception):
+    """Cube.js answered a query with an error."""
+
+class CubeClient:
+    """Client of the Cube.js REST API.
+
+    Replaces the ``CubeJsClient`` package pytrevl used to depend on, whose
+    HTTP requests could not be pooled, retried or given timeouts. Requests are sent through a :class:`requests.Session`
+    configured with :func:`configure_session`, so connections are pooled
+    and failed connections retried, and queries Cube.js is still computing
+    are polled until :attr:`max_wait`. The tokens are signed with PyJWT.
+
+    Parameters
+    ----------
+    server
+        The base URL of Cube.js, with or without ``'/cubejs-api/v1'``.
+    secret
+        The API secret the tokens are signed with.
+    timeout
+        The timeout of each request in seconds, either for connecting and
+        reading or as tuple ``(connect, read)``.
+    max_wait
+        How long to poll queries Cube.js is still computing ("Continue
+        wait") in seconds.
+    token_ttl
+        The lifetime of the tokens in seconds.
+    **session_options
+        Passed to :func:`configure_session`.
+    """
+    def __init__(self, server: str, secret: str, timeout: Timeout=None, max_wait: float=600, token_ttl: int=3600, **session_options):
+        import requests
+
+        self.server = server
+        api_root = server.rstrip('/')
+        if not api_root.endswith('/cubejs-api/v1'):
+            api_root = url_join(api_root, 'cubejs-api/v1')
+        self.load_url = url_join(api_root, 'load')
+        self.timeout = timeout
+        self.max_wait = max_wait
+        self.token_ttl = token_ttl
+        self._secret = secret
+        self._token = None
+        self._token_expires = 0.0
+        self._session = configure_session(requests.Session(), **session_options)
+
+    @property
+    def cache_key(self) -> str:
+        """Identity of the data served by this client, for caching query
+        results."""
+        return content_hash([self.load_url, hashlib.sha256(self._secret.encode()).hexdigest()])
+
+    def token(self) -> str:
+        now = time()
+        # Renew tokens shortly before they expire
+        if self._token is None or now > self._token_expires - 60:
+            import jwt
+
+            self._token = jwt.encode({'iat': int(now), 'exp': int(now) + self.token_ttl}, self._secret, algorithm='HS256')
+            self._token_expires = now + self.token_ttl
+        return self._token
+
+    def load(self, query: dict) -> list[dict]:
+        """Load the rows of ``query``.
+
+        Raises
+        ------
+        CubeError
+            If Cube.js answers with an error or the query is not ready
+            within :attr:`max_wait` seconds.
+        """
+        give_up = monotonic() + self.max_wait
+        delay = 0.1
+        while True:
+            resp = self._session.post(self.load_url, json={'query': query}, headers={'Authorization': self.token()}, timeout=self.timeout)
+            try:
+                body = resp.json()
+            except ValueError:
+                resp.raise_for_status()
+                raise
+            error = body.get('error')
+            if error == 'Continue wait' and monotonic() + delay < give_up:
+                sleep(delay)
+                delay = min(2 * delay, 2.0)
+                continue
+            if error is not None:
+                raise CubeError(f'Cube.js query failed ({resp.status_code}): {error}')
+            resp.raise_for_status()
+            return body['data']
+
+    def close(self):
+        self._session.close()
 
-def xmiddle(*args, **kwargs):
-    global _xmiddle
-    if not _xmiddle:
-        _xmiddle = XMiddleService.from_env(*args, **kwargs)
-    return _xmiddle
+def cube_client(server: str, secret: str, **options) -> CubeClient:
+    """Create a Cube.js client, see :class:`CubeClient`."""
+    return CubeClient(server, secret, **options)
+
+def _cube_client_from_env(server: str="CUBE_SERVER", secret: str="CUBE_SECRET", **options):
+    return cube_client(environ[server], environ[secret], **options)
+
+def _configured_client(kind: str, name: str, factory, **options):
+    """The client of the configuration ``name``, registering only the
+    ``'default'`` configuration on first use, so that misspelled names fail
+    instead of silently using the default endpoint."""
+    if name == 'default':
+        return clients.setdefault(kind, name, factory=factory, **options)
+    return clients.get(kind, name)
+
+def cube(server: str="CUBE_SERVER", secret: str="CUBE_SECRET", *, name: str='default', **options):
+    """The Cube.js client of the configuration ``name`` in :data:`clients`.
+
+    Each thread gets its own client. If the ``'default'`` configuration is
+    not registered, it is configured from the environment variables
+    ``server`` and ``secret``, and ``options`` are passed to
+    :class:`CubeClient`.
+
+    Raises
+    ------
+    KeyError
+        If another ``name`` is not registered.
+    """
+    return _configured_client('cube', name, _cube_client_from_env, server=server, secret=secret, **options)
+
+def _from_env_options(args: tuple, kwargs: dict) -> dict:
+    return {**dict(zip(('base_url', 'auth_password'), args)), **kwargs}
+
+def xmiddle(*args, name: str='default', **kwargs):
+    """The :class:`XMiddleService` of the configuration ``name`` in
+    :data:`clients`.
+
+    If the ``'default'`` configuration is not registered, it is configured
+    with :meth:`XMiddleService.from_env` and ``args`` and ``kwargs``.
+
+    Raises
+    ------
+    KeyError
+        If another ``name`` is not registered.
+    """
+    return _configured_client('xmiddle', name, XMiddleService.from_env, **_from_env_options(args, kwargs))
+
+def xmiddle_async(*args, name: str='default', **kwargs):
+    """The :class:`AsyncXMiddleService` of the configuration ``name`` in
+    :data:`clients`, see :func:`xmiddle`."""
+    return _configured_client('xmiddle_async', name, AsyncXMiddleService.from_env, **_from_env_options(args, kwargs))
+
+def resolve_client(kind: str, client=None):
+    """``client`` itself or, if ``None`` or the name of a configuration, the
+    client of that configuration in :data:`clients`.
+
+    Raises
+    ------
+    KeyError
+        If ``client`` is a name other than ``'default'`` which is not
+        registered.
+    """
+    if client is None or isinstance(client, str):
+        name = client or 'default'
+        return {'cube': cube, 'xmiddle': xmiddle, 'xmiddle_async': xmiddle_async}[kind](name=name)
+    return client
 
 class RenderError(Exception):
     def __init__(self, parent_error):
@@ -34,6 +227,62 @@ class RenderError(Exception):
             super().__init__(str(parent_error))
         self.parent_error = parent_error
 
+@dataclass
+class RenderResult:
+    """Outcome of rendering one dashboard in :meth:`XMiddleService.render_many`."""
+    # Position of the dashboard in the input
+    index: int
+    dashboard: "Dashboard"
+    response: Optional[dict] = None
+    # A RenderError, DeadlineExceeded or requests.RequestException, or when
+    # exporting an OSError or ValueError
+    error: Optional[Exception] = None
+    # Duration of the request in seconds
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class RenderBatch:
+    """Results of :meth:`XMiddleService.render_many`."""
+    results: list[RenderResult]
+    # Wall-clock duration of the whole batch in seconds
+    wall_time: float
+
+    @property
+    def request_time(self) -> float:
+        """Summed duration of all requests in seconds."""
+        return sum(r.elapsed for r in self.results)
+
+    @property
+    def speedup(self) -> float:
+        """Summed request time relative to the wall-clock time."""
+        return self.request_time / self.wall_time if self.wall_time else 1.0
+
+    @property
+    def responses(self) -> list[Optional[dict]]:
+        return [r.response for r in self.results]
+
+    @property
+    def errors(self) -> list[RenderResult]:
+        return [r for r in self.results if not r.ok]
+
+    def __len__(self):
+        return len(self.results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __str__(self):
+        return (
+            f'<RenderBatch {len(self.results)} dashboards, {len(self.errors)} errors, '
+            f'wall {self.wall_time:.3f}s, requests {self.request_time:.3f}s, speedup {self.speedup:.1f}x>'
+        )
+
+
 class XMiddleService:
     """Simple wrapper for x-middle API endpoints.
 
@@ -54,7 +303,18 @@ class XMiddleService:
     # The schemaVersion used when requesting x-middle API.
     schema_version: str = "v2"
 
-    def __init__(self, base_url: str, auth_password: Optional[str]=None, auth_username: str="pytrevl"):
+    def __init__(
+        self,
+        base_url: str,
+        auth_password: Optional[str]=None,
+        auth_username: str="pytrevl",
+        component_cache: Optional[LRUCache]=None,
+        component_ttl: Optional[float]=300,
+        timeout: Timeout=None,
+        compress_min_size: Optional[int]=1024,
+        hedge: Optional[HedgePolicy]=None,
+        **session_options,
+    ):
         """
         Use :method:`~XMiddleService.from_env` to create an instance using
         configuration from environment variables.
@@ -68,13 +328,42 @@ class XMiddleService:
             The password for HTTP-Basic auth for the API.
         auth_username
             The username for HTTP-Basic auth for the API.
+        component_cache
+            The cache for :meth:`render_components`. Defaults to a new
+            :class:`~pytrevl.cache.LRUCache`.
+        component_ttl
+            The time in seconds the default ``component_cache`` keeps
+            rendered components, as they contain live data. ``None`` keeps
+            them until they are evicted.
+        timeout
+            The timeout of each request in seconds, either for connecting
+            and reading or as tuple ``(connect, read)``.
+        compress_min_size
+            Request bodies of at least this many bytes are sent
+            gzip-compressed. ``None`` disables compression.
+        hedge
+            If given, slow renders are hedged with a second request, see
+            :class:`~pytrevl.hedging.HedgePolicy`. The latencies are
+            recorded in :attr:`latency`.
+        **session_options
+            Connection pooling and retry options, see
+            :func:`configure_session`.
         """
+        import requests
+
         self.api_root = url_join(base_url, 'dashboards')
-        self._session = requests.Session()
+        self.component_cache = LRUCache(maxsize=1024, ttl=component_ttl) if component_cache is None else component_cache
+        self.timeout = timeout
+        self.compress_min_size = compress_min_size
+        self.hedge = hedge
+        self.latency = LatencyHistogram()
+        self.pool_size = session_options.get('pool_size', 10)
+        self._session = configure_session(requests.Session(), **session_options)
+        # Runs hedged requests; threads are only started once requests are
+        # submitted
+        self._executor = ThreadPoolExecutor(max_workers=2 * self.pool_size, thread_name_prefix='pytrevl-hedge')
         if auth_password:
             self._session.auth = requests.auth.HTTPBasicAuth(auth_username, auth_password)
-        else:
-            self._session = requests.Session()
 
     @classmethod
     def from_env(cls, base_url: str="X_MIDDLE_BASEURL", auth_password: str="X_MIDDLE_PASSWORD", **kwargs):
@@ -84,12 +373,11 @@ class XMiddleService:
 
     def status(self):
         try:
-            return self._session.get(url_join(self.api_root, 'status')).json()
+            return self._session.get(url_join(self.api_root, 'status'), timeout=self.timeout).json()
         except ValueError:
             raise Exception("Empty response body. Have you provided the correct authentication username and/or password?")
 
-    def __call__(self, dashboard: "Dashboard", event=None, state=None) -> dict:
-        """Render a dashboard through the API."""
+    def _request_body(self, dashboard: "Dashboard", event=None, state=None) -> dict:
         body = {
             'schemaVersion': self.schema_version,
             'abstractConfig': dashboard.serialize(),
@@ -98,9 +386,377 @@ class XMiddleService:
             body['event'] = event
         if state:
             body['state'] = state
-        resp = self._session.post(self.api_root, json=body)
+        return body
+
+    def _send(self, data: bytes, headers: dict, deadline: Optional[float]=None) -> 'requests.Response':
+        import requests
+
+        start = monotonic()
+        try:
+            resp = self._session.post(self.api_root, data=data, headers=headers, timeout=cap_timeout(self.timeout, deadline))
+        except requests.Timeout as e:
+            if deadline is not None and monotonic() >= deadline:
+                raise DeadlineExceeded('Deadline exceeded') from e
+            raise
         try:
             resp.raise_for_status()
         except requests.HTTPError as e:
             raise RenderError(e)
-        return resp.json()
\ No newline at end of file
+        self.latency.record(monotonic() - start)
+        return resp
+
+    def _post(self, body: dict, deadline: Optional[float]=None) -> dict:
+        """Send a render request.
+
+        ``deadline`` is a :func:`time.monotonic` timestamp.
+        """
+        render = current_span()
+        with span('xmiddle.encode'):
+            data = json_dumpb(body)
+            headers = {'Content-Type': 'application/json'}
+            if self.compress_min_size is not None and len(data) >= self.compress_min_size:
+                data = gzip.compress(data, compresslevel=5)
+                headers['Content-Encoding'] = 'gzip'
+        render.set(request_bytes=len(data))
+
+        with span('xmiddle.request', request_bytes=len(data)) as request:
+            hedge_delay = self.hedge.delay(self.latency) if self.hedge else None
+            if deadline is None and hedge_delay is None:
+                resp = self._send(data, headers)
+            else:
+                resp = self._post_hedged(data, headers, deadline, hedge_delay)
+            request.set(status=resp.status_code, response_bytes=len(resp.content))
+        render.set(status=resp.status_code, response_bytes=len(resp.content))
+
+        with span('xmiddle.decode'):
+            return resp.json()
+
+    def _post_hedged(self, data: bytes, headers: dict, deadline: Optional[float], hedge_delay: Optional[float]) -> 'requests.Response':
+        """Send a request in the background, waiting at most until
+        ``deadline`` and sending a second request after ``hedge_delay``
+        seconds."""
+        remaining(deadline)
+        hedge_at = None if hedge_delay is None else monotonic() + hedge_delay
+        pending = {self._executor.submit(self._send, data, headers, deadline)}
+        error = None
+        try:
+            while pending:
+                timeouts = [t - monotonic() for t in (deadline, hedge_at) if t is not None]
+                done, pending = wait(pending, timeout=max(min(timeouts), 0) if timeouts else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+                if hedge_at is not None and (monotonic() >= hedge_at or (done and not pending)):
+                    # Hedge slow or failed requests once
+                    hedge_at = None
+                    pending.add(self._executor.submit(self._send, data, headers, deadline))
+                elif deadline is not None and monotonic() >= deadline:
+                    raise DeadlineExceeded('Deadline exceeded')
+            raise error
+        finally:
+            # Requests already running end at the latest with their timeout,
+            # which is capped by the deadline.
+            for future in pending:
+                future.cancel()
+
+    def _render(self, dashboard: "Dashboard", event=None, state=None, deadline: Optional[float]=None) -> dict:
+        """Render a dashboard, see :meth:`__call__`.
+
+        ``deadline`` is a :func:`time.monotonic` timestamp.
+        """
+        with span('xmiddle.render'):
+            return self._post(self._request_body(dashboard, event, state), deadline)
+
+    def __call__(self, dashboard: "Dashboard", event=None, state=None, deadline: Optional[float]=None) -> dict:
+        """Render a dashboard through the API.
+
+        Parameters
+        ----------
+        dashboard
+            The dashboard to render.
+        event, state
+            Passed through to x-middle.
+        deadline
+            If given, the maximum time in seconds the render may take.
+            :class:`~pytrevl.hedging.DeadlineExceeded` is raised when it
+            expires.
+        """
+        return self._render(dashboard, event, state, deadline_at(deadline))
+
+    def _render_one(self, index: int, dashboard: "Dashboard", **kwargs) -> RenderResult:
+        import requests
+
+        result = RenderResult(index, dashboard)
+        start = perf_counter()
+        try:
+            result.response = self._render(dashboard, **kwargs)
+        except (RenderError, DeadlineExceeded, requests.RequestException) as e:
+            result.error = e
+        result.elapsed = perf_counter() - start
+        return result
+
+    def render_many(self, dashboards: Iterable["Dashboard"], max_workers: int=8, ordered: bool=True, deadline: Optional[float]=None, **kwargs) -> RenderBatch:
+        """Render many dashboards concurrently.
+
+        Failing renders do not abort the batch, their :class:`RenderError`
+        (or :class:`~pytrevl.hedging.DeadlineExceeded`, or the
+        :class:`requests.RequestException` of a failed connection) is
+        stored in the corresponding :class:`RenderResult`.
+
+        Parameters
+        ----------
+        dashboards
+            The dashboards to render.
+        max_workers
+            The maximum number of requests running at the same time. Should
+            not exceed the ``pool_size`` of the client.
+        ordered
+            If ``True``, the results are in the order of ``dashboards``,
+            otherwise in the order the requests finished.
+        deadline
+            If given, the maximum time in seconds for the whole batch.
+        **kwargs
+            Passed through to :meth:`__call__`, e.g. ``event`` or ``state``.
+
+        Returns
+        -------
+        batch
+            The results of all renders together with timing information.
+        """
+        start = perf_counter()
+        kwargs['deadline'] = deadline_at(deadline)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pytrevl-render') as pool:
+            futures = [
+                pool.submit(self._render_one, i, dashboard, **kwargs)
+                for i, dashboard in enumerate(dashboards)
+            ]
+            if ordered:
+                results = [f.result() for f in futures]
+            else:
+                results = [f.result() for f in as_completed(futures)]
+        return RenderBatch(results, perf_counter() - start)
+
+    def render_components(self, dashboard: "Dashboard", max_workers: int=8, event=None, state=None, deadline: Optional[float]=None, use_cache: bool=True) -> dict:
+        """Render each component of a dashboard with a separate request.
+
+        The requests run concurrently. Each rendered component is cached by
+        the hash of its request, so after changing one component of a
+        dashboard, only that component is sent to x-middle again. Cached
+        components expire after ``component_ttl`` seconds.
+
+        Parameters
+        ----------
+        dashboard
+            The dashboard to render.
+        max_workers
+            The maximum number of requests running at the same time.
+        event, state, deadline
+            See :meth:`__call__`.
+        use_cache
+            If ``False``, all components are rendered again, e.g. to get
+            current data. The cache is updated with the results.
+
+        Returns
+        -------
+        response
+            The responses of all components combined into the form returned
+            by :meth:`__call__`.
+        """
+        responses = [None] * len(dashboard.components)
+        for result in self.iter_components(dashboard, max_workers, event, state, deadline, use_cache):
+            if result.error is not None:
+                raise result.error
+            responses[result.index] = result.response
+        return _combine_responses(responses)
+
+    def iter_components(self, dashboard: "Dashboard", max_workers: int=8, event=None, state=None, deadline: Optional[float]=None, use_cache: bool=True) -> Iterator[RenderResult]:
+        """Render each component of a dashboard with a separate request,
+        yielding the components as they arrive.
+
+        Cached components are yielded first. See :meth:`render_components`
+        for caching and the parameters.
+
+        Yields
+        ------
+        result
+            The response for the component at ``result.index`` of the
+            dashboard or, if rendering it failed, the error.
+        """
+        # The key covers every field of the request body, with the hash of
+        # the serialized component in place of the component
+        keys = [
+            content_hash({
+                'url': self.api_root,
+                'schemaVersion': self.schema_version,
+                'description': dashboard.description,
+                'component': c.content_hash,
+                'event': event,
+                'state': state,
+            })
+            for c in dashboard.components
+        ]
+
+        missing = []
+        for i, key in enumerate(keys):
+            resp = self.component_cache.get(key) if use_cache else None
+            if resp is None:
+                missing.append(i)
+            else:
+                yield RenderResult(i, dashboard, deepcopy(resp))
+        if not missing:
+            return
+
+        import requests
+
+        expires = deadline_at(deadline)
+
+        def render(i):
+            abstract_config = {'components': [dashboard.components[i].serialize()]}
+            if dashboard.description:
+                abstract_config['description'] = dashboard.description
+            body = {'schemaVersion': self.schema_version, 'abstractConfig': abstract_config}
+            if event:
+                body['event'] = event
+            if state:
+                body['state'] = state
+            result = RenderResult(i, dashboard)
+            start = perf_counter()
+            try:
+                result.response = self._post(body, expires)
+                self.component_cache.put(keys[i], result.response)
+                result.response = deepcopy(result.response)
+            except (RenderError, DeadlineExceeded, requests.RequestException) as e:
+                result.error = e
+            result.elapsed = perf_counter() - start
+            return result
+
+        pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pytrevl-render')
+        try:
+            for future in as_completed([pool.submit(render, i) for i in missing]):
+                yield future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._session.close()
+
+
+def _combine_responses(responses: list[dict]) -> dict:
+    """Combine responses of single-component renders into one response."""
+    combined = {'components': []}
+    for resp in responses:
+        for key, value in resp.items():
+            if key == 'components':
+                combined['components'].extend(value)
+            elif key not in combined:
+                combined[key] = value
+            elif isinstance(value, list):
+                combined[key] = combined[key] + value
+            elif isinstance(value, dict):
+                combined[key] = {**combined[key], **value}
+    return combined
+
+
+class AsyncXMiddleService:
+    """asyncio counterpart of :class:`XMiddleService`.
+
+    The dashboards are serialized in the event loop, the HTTP requests run
+    on a bounded pool of worker threads. Awaiting many renders at once (e.g.
+    with :func:`asyncio.gather`) therefore runs up to ``max_concurrency``
+    requests in parallel.
+
+    Examples
+    --------
+    >>> api = AsyncXMiddleService.from_env(max_concurrency=8)
+    >>> dashboards = # ...
+    >>> await asyncio.gather(*(api(d) for d in dashboards))
+    [{components: [ ... ], ...}, ...]
+    """
+
+    def __init__(self, base_url: str, auth_password: Optional[str]=None, auth_username: str="pytrevl", max_concurrency: int=10, **kwargs):
+        """
+        Use :method:`~AsyncXMiddleService.from_env` to create an instance
+        using configuration from environment variables.
+
+        Parameters
+        ----------
+        base_url, auth_password, auth_username
+            See :class:`XMiddleService`.
+        max_concurrency
+            The maximum number of requests running at the same time.
+        **kwargs
+            Other options of :class:`XMiddleService`. ``pool_size``
+            defaults to ``max_concurrency``.
+        """
+        kwargs.setdefault('pool_size', max_concurrency)
+        self._client = XMiddleService(base_url, auth_password, auth_username, **kwargs)
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='pytrevl-render')
+
+    @classmethod
+    def from_env(cls, base_url: str="X_MIDDLE_BASEURL", auth_password: str="X_MIDDLE_PASSWORD", **kwargs):
+        base_url = environ[base_url]
+        auth_password = environ[auth_password]
+        return cls(base_url, auth_password, **kwargs)
+
+    @property
+    def api_root(self) -> str:
+        return self._client.api_root
+
+    async def _run(self, func, *args):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the context to report to the current span
+        return await loop.run_in_executor(self._executor, copy_context().run, func, *args)
+
+    async def status(self):
+        return await self._run(self._client.status)
+
+    @property
+    def latency(self) -> LatencyHistogram:
+        return self._client.latency
+
+    async def __call__(self, dashboard: "Dashboard", event=None, state=None, deadline: Optional[float]=None) -> dict:
+        """Render a dashboard through the API.
+
+        See :meth:`XMiddleService.__call__` for the parameters. Awaiting the
+        render is cancelled when ``deadline`` expires.
+        """
+        import asyncio
+
+        expires = deadline_at(deadline)
+        with span('xmiddle.render'):
+            body = self._client._request_body(dashboard, event, state)
+            try:
+                return await asyncio.wait_for(self._run(self._client._post, body, expires), deadline)
+            except asyncio.TimeoutError as e:
+                raise DeadlineExceeded('Deadline exceeded') from e
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+# The clients used by default, e.g. by :meth:`Dashboard.render` and
+# :meth:`BaseCubeQuery.get_data`. Further endpoints can be registered by
+# name, e.g.::
+#
+#     clients.register('xmiddle', 'staging', base_url='https://...', auth_password='...')
+#     dashboard.render('staging')
+clients = ClientRegistry(
+    {
+        'cube': cube_client,
+        'xmiddle': XMiddleService,
+        'xmiddle_async': AsyncXMiddleService,
+    },
+    # Sessions are not guaranteed to be thread-safe
+    per_thread={'cube'},
+)
@@ -0,0 +1,228 @@
+"""Caches for rendered components and query results."""
+from collections import OrderedDict
+from dataclasses import dataclass
+import os
+from os import environ
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import monotonic, time
+from typing import Any, Hashable, Optional, TYPE_CHECKING
+import warnings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+_query_cache = None
+_query_cache_lock = Lock()
+
+def query_cache():
+    """The default cache for :meth:`~pytrevl.cube.BaseCubeQuery.get_data`.
+
+    Results are kept in memory for 10 minutes. If the environment variable
+    ``PYTREVL_CACHE_DIR`` is set and ``pyarrow`` is installed (the ``arrow``
+    extra), results are also stored as Arrow files in that directory and
+    shared between processes.
+    """
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            directory = environ.get('PYTREVL_CACHE_DIR')
+            if directory:
+                try:
+                    import pyarrow  # noqa: F401
+                except ImportError:
+                    warnings.warn(
+                        'PYTREVL_CACHE_DIR is set, but caching query results on disk requires pyarrow. '
+                        'Install pytrevl[arrow]. Query results are only cached in memory.'
+                    )
+                    directory = None
+            _query_cache = QueryCache(ttl=600, directory=directory)
+        return _query_cache
+
+
+@dataclass
+class CacheStats:
+    """Counters of a cache."""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LRUCache:
+    """Thread-safe, bounded mapping evicting the least recently used items.
+
+    Parameters
+    ----------
+    maxsize
+        The maximum number of items to keep.
+    ttl
+        If given, items expire after ``ttl`` seconds.
+    """
+    def __init__(self, maxsize: int=128, ttl: Optional[float]=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Optional[Any]=None):
+        """Get the item for ``key`` or ``default`` if it is not cached."""
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.stats.misses += 1
+                return default
+            if expires is not None and expires < monotonic():
+                del self._data[key]
+                self.stats.evictions += 1
+                self.stats.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """Cache ``value`` for ``key``."""
+        expires = None if self.ttl is None else monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ArrowDiskCache:
+    """Cache for data frames stored as Arrow IPC files in a directory.
+
+    The files are memory-mapped when read, so processes on the same host
+    reading the same entry share the pages of the operating system's file
+    cache instead of holding their own copy. Requires ``pyarrow``.
+
+    Parameters
+    ----------
+    directory
+        The directory for the cache files. It is created if missing.
+    ttl
+        If given, files older than ``ttl`` seconds are ignored and removed.
+    """
+    suffix = '.arrow'
+
+    def __init__(self, directory: str, ttl: Optional[float]=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.stats = CacheStats()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}{self.suffix}')
+
+    def get(self, key: str) -> Optional['pd.DataFrame']:
+        """Get the data frame for ``key`` or ``None`` if it is not cached."""
+        import pyarrow as pa
+
+        path = self._path(key)
+        try:
+            if self.ttl is not None and os.path.getmtime(path) + self.ttl < time():
+                os.remove(path)
+                self.stats.evictions += 1
+                self.stats.misses += 1
+                return None
+            with pa.memory_map(path, 'r') as source:
+                table = pa.ipc.open_file(source).read_all()
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return table.to_pandas(split_blocks=True)
+
+    def put(self, key: str, df: 'pd.DataFrame'):
+        """Store ``df`` for ``key``."""
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # Write to a temporary file first so that readers never see partial
+        # files.
+        f = NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False)
+        try:
+            with f:
+                with pa.ipc.new_file(f, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(f.name, self._path(key))
+        except BaseException:
+            os.unlink(f.name)
+            raise
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                os.remove(os.path.join(self.directory, name))
+
+
+class QueryCache:
+    """Two-tiered cache for query results.
+
+    Results are looked up in a bounded in-memory :class:`LRUCache` first and
+    then, if ``directory`` is given, in an :class:`ArrowDiskCache`. Results
+    found on disk are moved into memory.
+
+    Cached data frames are returned as shallow copies, i.e. adding or
+    removing columns is fine, but values must not be changed in-place.
+
+    Parameters
+    ----------
+    maxsize
+        The maximum number of results kept in memory.
+    ttl
+        If given, results expire after ``ttl`` seconds.
+    directory
+        If given, results are also stored as Arrow files in this directory.
+    """
+    def __init__(self, maxsize: int=128, ttl: Optional[float]=None, directory: Optional[str]=None):
+        self.memory = LRUCache(maxsize, ttl)
+        self.disk = ArrowDiskCache(directory, ttl) if directory else None
+
+    @property
+    def stats(self) -> dict[str, CacheStats]:
+        """The counters of each tier."""
+        stats = {'memory': self.memory.stats}
+        if self.disk:
+            stats['disk'] = self.disk.stats
+        return stats
+
+    def get(self, key: str) -> Optional['pd.DataFrame']:
+        """Get the data frame for ``key`` or ``None`` if it is not cached."""
+        df = self.memory.get(key)
+        if df is None and self.disk:
+            df = self.disk.get(key)
+            if df is not None:
+                self.memory.put(key, df)
+        return None if df is None else df.copy(deep=False)
+
+    def put(self, key: str, df: 'pd.DataFrame'):
+        self.memory.put(key, df)
+        if self.disk:
+            self.disk.put(key, df)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk:
+            self.disk.clear()
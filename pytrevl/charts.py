@@ -1,26 +1,153 @@
+from itertools import chain
 from typing import Literal, Optional,TYPE_CHECKING, Union
-import pandas as pd
-import yaml
 
-from .dashboard import QueryingKwargsComponent, Dashboard
-from .utils import merge
+from .dashboard import BaseComponent, QueryingKwargsComponent, Dashboard
+from .instrument import span
+from .utils import merge, yaml_load
 
 if TYPE_CHECKING:
+    import pandas as pd
     from .cube import BaseCubeQuery
 
+# Keys of data points given as arrays, e.g. ``[x, y]``, by array length
+_POINT_ARRAY_KEYS = {
+    1: ('y',),
+    2: ('x', 'y'),
+    3: ('x', 'y', 'z'),
+}
+# Keys of array points of series types that differ from _POINT_ARRAY_KEYS
+_SERIES_POINT_ARRAY_KEYS = {
+    'heatmap': {3: ('x', 'y', 'value')},
+}
+
+
+def _point_array_keys(series: dict, length: int, default_type: str='line') -> Optional[tuple]:
+    """The keys of the array points with ``length`` values of ``series``,
+    whose type defaults to ``default_type``."""
+    if series.get('keys'):
+        return tuple(series['keys'])
+    series_type = series.get('type', default_type)
+    return _SERIES_POINT_ARRAY_KEYS.get(series_type, {}).get(length) or _POINT_ARRAY_KEYS.get(length)
+
+
+def _chart_type(rendered_chart: dict) -> str:
+    """The default series type of a rendered chart."""
+    chart = rendered_chart.get('chart')
+    # Highcharts' default series type is 'line'
+    return chart.get('type', 'line') if isinstance(chart, dict) else 'line'
+
+
+def _point_columns(series: list[dict], lengths: list[int], default_type: str='line') -> dict[str, list]:
+    """Collect the values of all data points of all series by key.
+
+    The columns are allocated once for all series, values missing in a
+    series or data point are ``None``. ``default_type`` is the type of
+    series without their own.
+    """
+    total = sum(lengths)
+    columns = {}
+    offset = 0
+    for s, n in zip(series, lengths):
+        data = s['data']
+        if not n:
+            continue
+        first = data[0]
+        if isinstance(first, dict):
+            keys = dict.fromkeys(chain.from_iterable(data))
+            items = ((k, [p.get(k) for p in data]) for k in keys)
+        elif isinstance(first, (list, tuple)):
+            items = zip(_point_array_keys(s, len(first), default_type), zip(*data))
+        else:
+            items = [('y', data)]
+
+        for key, values in items:
+            col = columns.get(key)
+            if col is None:
+                col = columns[key] = [None] * total
+            col[offset:offset + n] = values
+        offset += n
+    return columns
+
+
+def _resolve_categories(values: list, categories: list):
+    """Replace category indices in ``values`` by the categories."""
+    import numpy as np
+    import pandas as pd
+
+    categories = np.asarray(categories, dtype=object)
+    try:
+        codes = np.asarray(values, dtype=np.intp)
+    except (TypeError, ValueError):
+        # Missing or non-numeric values
+        return pd.Series(values).map(dict(enumerate(categories))).to_numpy()
+    valid = (codes >= 0) & (codes < len(categories))
+    if valid.all():
+        return categories[codes]
+    resolved = np.full(len(codes), np.nan, dtype=object)
+    resolved[valid] = categories[codes[valid]]
+    return resolved
+
+
+def _series_attribute(series: list[dict], lengths: list[int], key: str) -> Optional['pd.Categorical']:
+    """Build a categorical column of the series attribute ``key``."""
+    import numpy as np
+    import pandas as pd
+
+    values = [s.get(key) for s in series]
+    if all(v is None for v in values):
+        return None
+    categories = list(dict.fromkeys(v for v in values if v is not None))
+    index = {c: i for i, c in enumerate(categories)}
+    codes = np.array([-1 if v is None else index[v] for v in values], dtype=np.intp)
+    return pd.Categorical.from_codes(np.repeat(codes, lengths), categories=categories)
+
+
+def _axis_categories(rendered_chart: dict, axis: str) -> Optional[list]:
+    axis = rendered_chart.get(axis)
+    if isinstance(axis, dict):
+        return axis.get('categories')
+    return None
+
+
+def extract_chart_dataframe(rendered_chart: dict, series: Optional[list[dict]]=None) -> 'pd.DataFrame':
+    """Extract the data points of a rendered chart into a data frame.
+
+    The data is collected column by column for all series at once. Indices of
+    categorical axes are replaced by the categories and the series' ``name``
+    and ``stack`` are added as categorical columns ``series_name`` and
+    ``stack``.
+
+    Parameters
+    ----------
+    rendered_chart
+        The chart as rendered by x-middle.
+    series
+        The series to extract. Defaults to all series of ``rendered_chart``.
+    """
+    import pandas as pd
+
+    if series is None:
+        series = rendered_chart['series']
+    lengths = [len(s['data']) for s in series]
+
+    columns = _point_columns(series, lengths, _chart_type(rendered_chart))
+    for key, axis in (('x', 'xAxis'), ('y', 'yAxis')):
+        categories = _axis_categories(rendered_chart, axis)
+        if categories is not None and key in columns:
+            columns[key] = _resolve_categories(columns[key], categories)
+
+    for key, column in (('name', 'series_name'), ('stack', 'stack')):
+        values = _series_attribute(series, lengths, key)
+        if values is not None:
+            columns[column] = values
+
+    return pd.DataFrame(columns, index=pd.RangeIndex(sum(lengths)))
+
+
 def extract_dataframe(series, rendered_chart):
-    df = pd.DataFrame.from_records(series["data"])
-    if "name" in series:
-        df["series_name"] = series["name"]
-    if "stack" in series:
-        df["stack"] = series["stack"]
-    if "xAxis" in rendered_chart:
-        m = dict(enumerate(rendered_chart["xAxis"]["categories"]))
-        df["x"] = df["x"].map(m)
-    if "yAxis" in rendered_chart:
-        m = dict(enumerate(rendered_chart["yAxis"]["categories"]))
-        df["y"] = df["y"].map(m)
-    return df
+    """Extract the data points of a single series, see
+    :func:`extract_chart_dataframe`."""
+    return extract_chart_dataframe(rendered_chart, [series])
 
 
 class BaseChart(QueryingKwargsComponent):
@@ -47,8 +174,14 @@ class BaseChart(QueryingKwargsComponent):
     :attr:`_default` and :attr:`_kw_paths`.  The results are assigned to
     :attr:`default` and :attr:`kw_paths` via the meta-class
     :class:`MergeWithBase`.
+
+    If :attr:`max_points` is set, the series of the rendered chart are
+    downsampled to at most that many points for display, see
+    :func:`~pytrevl.downsample.downsample_chart`. :meth:`get_data` always
+    returns all points.
     """
     type = 'chart'
+    max_points: Optional[int] = None
 
     _default: dict = {
         'chart': {
@@ -67,10 +200,20 @@ class BaseChart(QueryingKwargsComponent):
         'y': 'series.0.data.y',
         'z': 'series.0.data.z',
     }
+    def render(self, *args, **kwargs):
+        resp = super().render(*args, **kwargs)
+        if self.max_points:
+            from .downsample import downsample_chart
+            resp, _ = downsample_chart(resp, self.max_points)
+        return resp
+
     def get_data(self, *args, **kwargs):
-        resp = self.render(*args, **kwargs)
-        dfs = [extract_dataframe(series, resp) for series in resp["series"]]
-        return pd.concat(dfs, ignore_index=True)
+        with span('chart.get_data') as s:
+            resp = super().render(*args, **kwargs)
+            with span('chart.extract'):
+                df = extract_chart_dataframe(resp)
+            s.set(rows=len(df))
+            return df
 
 
 class LineChart(BaseChart):
@@ -93,6 +236,9 @@ class LineChart(BaseChart):
         The query column to sort the data by. Defaults to the x-axis.
     order_direction
         The direction how to sort the data. Defaults to ascending order.
+    max_points
+        If given, series with more points are downsampled for display, see
+        :attr:`BaseChart.max_points`.
     """
     _default: dict = {
         'chart': {
@@ -111,6 +257,7 @@ class LineChart(BaseChart):
         y: Optional[str]=None,
         order_by: Optional[str]=None,
         order_direction: Union[Literal['asc'], Literal['desc']]='asc',
+        max_points: Optional[int]=None,
         **kwargs,
     ):
         if x is None:
@@ -121,9 +268,10 @@ class LineChart(BaseChart):
             order_by = x
 
         super().__init__(
-            **self._filter_locals(locals()),
+            **self._filter_locals(locals(), {'kwargs', 'self', '__class__', 'max_points'}),
             **kwargs,
         )
+        self.max_points = max_points
 
 
 class ColumnChart(BaseChart):
@@ -214,7 +362,10 @@ class CustomChart(BaseChart):
         self.id = trevl_code['id']
         self.trevl_code = trevl_code
         self.custom = {}
-   
+
+    # Not cached, ``trevl_code`` may be changed in place at any depth
+    content_hash = BaseComponent.content_hash
+
     def serialize(self):
         display = merge(
             self.trevl_code['display'],
@@ -227,4 +378,4 @@ class CustomChart(BaseChart):
     
     @classmethod
     def from_yaml(cls, code: str):
-        return cls(yaml.safe_load(code))
+        return cls(yaml_load(code))
@@ -0,0 +1,191 @@
+"""Local evaluation of computed fields.
+
+The ``code`` of a :class:`~pytrevl.cube.Computed` field is evaluated as a
+Python expression on whole columns of a data frame. Supported are
+
+- numbers, strings, ``True``, ``False`` and ``None``,
+- the names of the computed field's ``arguments`` and of previously computed
+  fields,
+- arithmetic operators (``+``, ``-``, ``*``, ``/``, ``//``, ``%``, ``**``),
+- comparisons (``==``, ``!=``, ``<``, ``<=``, ``>``, ``>=``, also chained),
+- ``and``, ``or`` and ``not`` (element-wise on the truth values of their
+  operands, with missing values as ``False``; the results are booleans),
+- conditional expressions (``a if condition else b``),
+- the functions in :data:`FUNCTIONS`, e.g. ``sum(x)`` or ``round(x, 2)``.
+
+Everything else raises a :class:`ComputedError`.
+"""
+import ast
+import operator
+from typing import Any, Mapping
+
+import numpy as np
+import pandas as pd
+
+
+class ComputedError(ValueError):
+    """A computed field cannot be evaluated locally."""
+
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+def _truth(value):
+    """The truth value of ``value``, element-wise for columns. Missing
+    values are ``False``."""
+    if isinstance(value, pd.Series):
+        valid = value.notna().to_numpy()
+        truth = np.zeros(len(value), dtype=bool)
+        truth[valid] = np.asarray(value[valid]).astype(bool)
+        return pd.Series(truth, index=value.index)
+    return not pd.isna(value) and bool(value)
+
+
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+    ast.Not: lambda v: ~_truth(v) if isinstance(v, pd.Series) else not _truth(v),
+}
+
+_COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+_BOOLEAN_OPERATORS = {
+    ast.And: operator.and_,
+    ast.Or: operator.or_,
+}
+
+# Functions available in computed fields. Aggregations reduce a column to a
+# single value that is broadcast to all rows.
+FUNCTIONS = {
+    'abs': abs,
+    'round': lambda v, digits=0: v.round(digits) if isinstance(v, pd.Series) else round(v, digits),
+    'sum': lambda v: v.sum(),
+    'mean': lambda v: v.mean(),
+    'avg': lambda v: v.mean(),
+    'median': lambda v: v.median(),
+    'min': lambda v: v.min(),
+    'max': lambda v: v.max(),
+    'std': lambda v: v.std(),
+    'count': lambda v: v.count(),
+}
+
+
+class _Evaluator:
+    def __init__(self, code: str, names: Mapping[str, Any]):
+        self.code = code
+        self.names = names
+
+    def error(self, node: ast.AST, reason: str):
+        return ComputedError(f'Cannot evaluate {self.code!r} locally: {reason} ({ast.unparse(node)!r})')
+
+    def visit(self, node: ast.AST):
+        method = getattr(self, f'visit_{type(node).__name__}', None)
+        if method is None:
+            raise self.error(node, f'unsupported expression {type(node).__name__}')
+        return method(node)
+
+    def visit_Expression(self, node):
+        return self.visit(node.body)
+
+    def visit_Constant(self, node):
+        return node.value
+
+    def visit_Name(self, node):
+        try:
+            return self.names[node.id]
+        except KeyError:
+            raise self.error(node, f'unknown name {node.id!r}') from None
+
+    def visit_BinOp(self, node):
+        op = _BINARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise self.error(node, f'unsupported operator {type(node.op).__name__}')
+        return op(self.visit(node.left), self.visit(node.right))
+
+    def visit_UnaryOp(self, node):
+        op = _UNARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise self.error(node, f'unsupported operator {type(node.op).__name__}')
+        return op(self.visit(node.operand))
+
+    def visit_Compare(self, node):
+        result = None
+        left = self.visit(node.left)
+        for op, comparator in zip(node.ops, node.comparators):
+            func = _COMPARISONS.get(type(op))
+            if func is None:
+                raise self.error(node, f'unsupported comparison {type(op).__name__}')
+            right = self.visit(comparator)
+            value = func(left, right)
+            result = value if result is None else result & value
+            left = right
+        return result
+
+    def visit_BoolOp(self, node):
+        op = _BOOLEAN_OPERATORS[type(node.op)]
+        result, *rest = [_truth(self.visit(v)) for v in node.values]
+        for value in rest:
+            result = op(result, value)
+        return result
+
+    def visit_IfExp(self, node):
+        condition = self.visit(node.test)
+        body, orelse = self.visit(node.body), self.visit(node.orelse)
+        if isinstance(condition, pd.Series):
+            return pd.Series(np.where(condition, body, orelse), index=condition.index)
+        return body if condition else orelse
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            raise self.error(node, f'unsupported function. Supported functions are: {", ".join(sorted(FUNCTIONS))}')
+        if node.keywords:
+            raise self.error(node, 'keyword arguments are not supported')
+        return FUNCTIONS[node.func.id](*(self.visit(arg) for arg in node.args))
+
+
+def evaluate(code: str, names: Mapping[str, Any]):
+    """Evaluate the code of a computed field.
+
+    Parameters
+    ----------
+    code
+        The expression to evaluate, see the module documentation.
+    names
+        The values of the names used in ``code``, usually columns of a data
+        frame.
+
+    Returns
+    -------
+    result
+        A column or, if ``code`` does not depend on any column, a scalar.
+    """
+    try:
+        tree = ast.parse(code, mode='eval')
+    except SyntaxError as e:
+        raise ComputedError(f'Cannot evaluate {code!r} locally: invalid syntax') from e
+    return _Evaluator(code, names).visit(tree)
+
+
+def as_numeric(column: pd.Series) -> pd.Series:
+    """Convert ``column`` to numbers if all of its values are numeric.
+
+    Cube.js returns measures as strings.
+    """
+    try:
+        return pd.to_numeric(column)
+    except (ValueError, TypeError):
+        return column
@@ -1,10 +1,21 @@
 """Containers for Cube.js based queries in TREVL."""
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from dataclasses import dataclass, field
-from typing import Optional
-import pandas as pd
+from itertools import chain
+import re
+from typing import Iterator, Literal, Optional, Sequence, TYPE_CHECKING, Union
+from uuid import uuid4
+from weakref import WeakKeyDictionary
 
-from .api import cube
+from .api import resolve_client
+from .cache import query_cache
+from .instrument import current_span, span
+from .utils import content_hash
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
 
 @dataclass
 class Filter:
@@ -28,12 +39,321 @@ class Computed:
     arguments: Optional[dict[str, str]] = field(default_factory=dict)
 
 
+# Cube.js' format of timestamps, e.g. '2023-01-31T00:00:00.000'
+_TIMESTAMP = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}')
+
+
+# Identities of clients without a cache_key, see client_key()
+_client_ids: 'WeakKeyDictionary[object, str]' = WeakKeyDictionary()
+
+
+def client_key(client) -> Optional[str]:
+    """Identity of the data served by a Cube.js client, part of the cache
+    key of query results.
+
+    Clients can define it with a ``cache_key`` attribute, e.g. the server
+    URL (see :attr:`~pytrevl.api.CubeClient.cache_key`). Results of other
+    clients are only cached for that client object, and not at all if it
+    cannot be weakly referenced (``None``).
+    """
+    key = getattr(client, 'cache_key', None)
+    if isinstance(key, str):
+        return key
+    try:
+        return _client_ids.setdefault(client, uuid4().hex)
+    except TypeError:
+        return None
+
+
+def _first_value(values: list):
+    return next((v for v in values if v is not None), None)
+
+
+def _to_datetime(values: list) -> 'pd.Series':
+    import pandas as pd
+
+    try:
+        return pd.to_datetime(pd.Series(values), format='ISO8601')
+    except (TypeError, ValueError):
+        # pandas < 2 does not know format='ISO8601'
+        return pd.to_datetime(pd.Series(values))
+
+
+def _typed_column(values: list, measure: bool, categorical_ratio: float):
+    import pandas as pd
+    from .computed import as_numeric
+
+    first = _first_value(values)
+    if isinstance(first, str) and _TIMESTAMP.match(first):
+        try:
+            return _to_datetime(values)
+        except (TypeError, ValueError):
+            # Not all values are timestamps
+            pass
+    if measure:
+        return as_numeric(pd.Series(values))
+    column = pd.Series(values)
+    if column.dtype == object and column.nunique() <= categorical_ratio * len(column):
+        return column.astype('category')
+    return column
+
+
+def records_to_frame(records: list[dict], measures: Sequence[str]=(), categorical_ratio: float=0.5) -> 'pd.DataFrame':
+    """Build a typed data frame from the records returned by Cube.js.
+
+    Cube.js returns numbers as strings and timestamps in ISO format.
+    Timestamps are converted to ``datetime64``, the columns in ``measures``
+    to numbers and other (i.e. dimension) columns with few distinct values
+    to categoricals.
+
+    Parameters
+    ----------
+    records
+        The rows of the result.
+    measures
+        The names of the measure columns.
+    categorical_ratio
+        Dimension columns with at most ``categorical_ratio * len(records)``
+        distinct values become categoricals.
+    """
+    import pandas as pd
+
+    measures = set(measures)
+    columns = {
+        key: _typed_column([r.get(key) for r in records], key in measures, categorical_ratio)
+        for key in dict.fromkeys(chain.from_iterable(records))
+    }
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(records)))
+
+
+def _arrow_numeric(column: 'pa.Array') -> 'pa.Array':
+    import pyarrow as pa
+
+    if not pa.types.is_string(column.type):
+        return column
+    for numeric in (pa.int64(), pa.float64()):
+        try:
+            return column.cast(numeric)
+        except (TypeError, ValueError):
+            pass
+    return column
+
+
+def _arrow_column(values: list, measure: bool, categorical_ratio: float) -> 'pa.Array':
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    first = _first_value(values)
+    if isinstance(first, str) and _TIMESTAMP.match(first):
+        try:
+            return pa.array(values, type=pa.string()).cast(pa.timestamp('ns'))
+        except (TypeError, ValueError):
+            # Not all values are timestamps
+            pass
+    try:
+        column = pa.array(values)
+    except (TypeError, ValueError):
+        # Mixed types
+        column = pa.array([None if v is None else str(v) for v in values], type=pa.string())
+    if measure:
+        return _arrow_numeric(column)
+    if pa.types.is_string(column.type) and pc.count_distinct(column).as_py() <= categorical_ratio * len(column):
+        return column.dictionary_encode()
+    return column
+
+
+def records_to_table(records: list[dict], measures: Sequence[str]=(), categorical_ratio: float=0.5) -> 'pa.Table':
+    """Build a typed :class:`pyarrow.Table` from the records returned by
+    Cube.js, without a detour through pandas.
+
+    The columns are typed like those of :func:`records_to_frame`, with
+    dictionary-encoded columns instead of categoricals.
+    """
+    import pyarrow as pa
+
+    measures = set(measures)
+    keys = dict.fromkeys(chain.from_iterable(records))
+    return pa.table({
+        key: _arrow_column([r.get(key) for r in records], key in measures, categorical_ratio)
+        for key in keys
+    })
+
+
+def _paging_order(query: dict):
+    """The ``order`` of ``query`` with all dimensions as tie-breakers, so
+    that pages requested with ``limit`` and ``offset`` do not overlap."""
+    order = query.get('order') or []
+    if isinstance(order, dict):
+        order = list(order.items())
+    ordered = {member for member, _ in order}
+    return [list(o) for o in order] + [[d, 'asc'] for d in query.get('dimensions', []) if d not in ordered]
+
+
 class BaseCubeQuery:
-    def get_data(self, client=None):
-        if client is None:
-            client = cube()
-        resp = client.load(self.serialize(include_computed=False))
-        return pd.DataFrame.from_records(resp)
+    computed: list[Computed]
+    measures: list[str]
+
+    def get_data(self, client=None, cache=None, include_computed=False, format: Union[Literal['pandas'], Literal['arrow']]='pandas'):
+        """Load the query result from Cube.js.
+
+        Parameters
+        ----------
+        client
+            The Cube.js client or the name of a client configuration in
+            :data:`~pytrevl.api.clients`. Defaults to :func:`~pytrevl.api.cube`.
+        cache
+            The :class:`~pytrevl.cache.QueryCache` to use. Defaults to
+            :func:`~pytrevl.cache.query_cache`; ``False`` disables caching.
+            Results are cached per query and client, see :func:`client_key`.
+        include_computed
+            If ``True``, the computed fields are evaluated locally and added
+            as columns, see :mod:`pytrevl.computed`.
+        format
+            ``'pandas'`` for a :class:`pandas.DataFrame` or ``'arrow'`` for a
+            :class:`pyarrow.Table` (requires ``pyarrow``). The columns are
+            typed in both cases, see :func:`records_to_frame` and
+            :func:`records_to_table`.
+        """
+        if format not in ('pandas', 'arrow'):
+            raise ValueError(f"format must be 'pandas' or 'arrow', got {format!r}")
+        with span('cube.get_data') as s:
+            data = self._load(client, cache, format)
+            if include_computed:
+                if format == 'arrow':
+                    import pyarrow as pa
+                    data = pa.Table.from_pandas(self.add_computed(data.to_pandas(split_blocks=True)), preserve_index=False)
+                else:
+                    data = self.add_computed(data)
+            s.set(rows=len(data))
+            return data
+
+    def _to_frame(self, records: list[dict]) -> 'pd.DataFrame':
+        return records_to_frame(records, [self._column(m) for m in self.measures])
+
+    def _to_table(self, records: list[dict]) -> 'pa.Table':
+        return records_to_table(records, [self._column(m) for m in self.measures])
+
+    def iter_data(self, chunk_size: int=10000, client=None, prefetch: bool=True, include_computed=False) -> Iterator['pd.DataFrame']:
+        """Load the query result from Cube.js page by page.
+
+        The pages are requested with Cube.js' ``limit`` and ``offset``, so
+        only one page (two with ``prefetch``) is held in memory at a time.
+        To make the pages consistent, the rows are ordered by all dimensions
+        after the ``order`` of the query, if any. Results are not cached.
+
+        Parameters
+        ----------
+        chunk_size
+            The number of rows per page. Must not exceed the row limit of the
+            Cube.js deployment.
+        client
+            The Cube.js client or the name of a client configuration in
+            :data:`~pytrevl.api.clients`. Defaults to :func:`~pytrevl.api.cube`.
+        prefetch
+            If ``True``, the next page is loaded in the background while the
+            current page is processed.
+        include_computed
+            If ``True``, the computed fields are evaluated on each page, see
+            :meth:`add_computed`. Note that aggregations in computed fields
+            only see the rows of the current page.
+
+        Yields
+        ------
+        df
+            The rows of one page.
+        """
+        client = resolve_client('cube', client)
+        query = self.serialize(include_computed=False)
+        order = _paging_order(query)
+        if order:
+            query['order'] = order
+
+        def load(offset):
+            return client.load({**query, 'limit': chunk_size, 'offset': offset})
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pytrevl-prefetch') if prefetch else None
+        try:
+            offset = 0
+            pending = executor.submit(load, offset) if executor else None
+            while True:
+                records = pending.result() if executor else load(offset)
+                offset += chunk_size
+                last = len(records) < chunk_size
+                if executor and not last:
+                    pending = executor.submit(load, offset)
+                if records:
+                    df = self._to_frame(records)
+                    del records
+                    if include_computed:
+                        df = self.add_computed(df)
+                    yield df
+                if last:
+                    break
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def add_computed(self, df: 'pd.DataFrame') -> 'pd.DataFrame':
+        """Evaluate the computed fields on the query result ``df``.
+
+        Returns
+        -------
+        df
+            A copy of ``df`` with a column for each computed field.
+        """
+        from .computed import as_numeric, evaluate
+
+        df = df.copy(deep=False)
+        names = {}
+        for c in self.computed:
+            for dst, src in (c.arguments or {}).items():
+                names[dst] = as_numeric(df[self._column(src)])
+            value = evaluate(c.code, names)
+            df[c.name] = value
+            names[c.name] = df[c.name]
+        return df
+
+    def _column(self, field: str) -> str:
+        """The column name of ``field`` in the query result."""
+        raise NotImplementedError('Method _column must be implemented in sub-class')
+
+    def _load(self, client=None, cache=None, format: str='pandas'):
+        """The typed query result as data frame or, if ``format`` is
+        ``'arrow'``, as :class:`pyarrow.Table`."""
+        client = resolve_client('cube', client)
+        if cache is None:
+            cache = query_cache()
+
+        query = self.serialize(include_computed=False)
+        identity = client_key(client)
+        if identity is None:
+            cache = False
+        if cache is not False:
+            key = content_hash([identity, query])
+            df = cache.get(key)
+            current_span().set(cached=df is not None)
+            if df is not None:
+                if format == 'arrow':
+                    import pyarrow as pa
+                    return pa.Table.from_pandas(df, preserve_index=False)
+                return df
+
+        with span('cube.load'):
+            resp = client.load(query)
+        with span('cube.to_frame', rows=len(resp)):
+            if format == 'arrow':
+                data = self._to_table(resp)
+            else:
+                data = self._to_frame(resp)
+        del resp
+        if cache is not False:
+            if format == 'arrow':
+                # The cache holds data frames
+                cache.put(key, data.to_pandas(split_blocks=True))
+            else:
+                cache.put(key, data)
+                data = data.copy(deep=False)
+        return data
 
     def __getitem__(self, field):
         raise NotImplementedError('Method __getitem__ must be implemented in sub-class')
@@ -90,6 +410,9 @@ class CubeQuery(BaseCubeQuery):
             ', '.join(sorted((*self.measures, *self.dimensions, *(c.name for c in self.computed))))
             )
 
+    def _column(self, field: str) -> str:
+        return f'{self.cube}.{field}'
+
     def _prepend_cube(self, fields: list[str]) -> list[str]:
         return [f'{self.cube}.{f}' for f in fields]
 
@@ -175,6 +498,9 @@ class MultiCubeQuery(BaseCubeQuery):
             ', '.join(sorted((*self.measures, *self.dimensions, *computed_fields)))
         )
 
+    def _column(self, field: str) -> str:
+        return field
+
     def serialize(self, include_computed=True) -> dict:
         ret = {}
 
@@ -190,3 +516,79 @@ class MultiCubeQuery(BaseCubeQuery):
         if include_computed and self.computed:
             ret['computed'] = self.computed
         return deepcopy(ret)
+
+
+def _merge_key(query: BaseCubeQuery):
+    """Key of queries that can be merged into a single query.
+
+    Queries on the same cube with the same dimensions and filters only differ
+    in their measures and can be loaded with the union of their measures.
+    Other queries can only be merged with identical queries.
+    """
+    if isinstance(query, CubeQuery):
+        return (
+            query.cube,
+            tuple(sorted(query.dimensions)),
+            tuple(sorted(content_hash(query._serialize_filter(f)) for f in query.filters)),
+        )
+    return content_hash(query.serialize(include_computed=False))
+
+
+def merge_queries(queries: Sequence[BaseCubeQuery]) -> tuple[list[BaseCubeQuery], list[int]]:
+    """Merge queries to reduce the number of requests to Cube.js.
+
+    Duplicate queries are removed and :class:`CubeQuery` instances on the
+    same cube with the same dimensions and filters are merged into one query
+    with the union of their measures.
+
+    Returns
+    -------
+    merged
+        The merged queries.
+    indices
+        For each of ``queries`` the index of the query in ``merged`` that
+        contains its data.
+    """
+    merged = []
+    indices = []
+    positions = {}
+    for query in queries:
+        key = _merge_key(query)
+        if key not in positions:
+            positions[key] = len(merged)
+            if isinstance(query, CubeQuery):
+                query = CubeQuery(query.cube, list(query.measures), list(query.dimensions), list(query.filters))
+            merged.append(query)
+        elif isinstance(query, CubeQuery):
+            target = merged[positions[key]]
+            target.measures.extend(m for m in query.measures if m not in target.measures)
+        indices.append(positions[key])
+    return merged, indices
+
+
+def load_queries(queries: Sequence[BaseCubeQuery], client=None, cache=None, include_computed=False) -> list['pd.DataFrame']:
+    """Load the data of many queries with as few requests as possible.
+
+    See :func:`merge_queries` for how the queries are combined. The
+    parameters are passed through to :meth:`BaseCubeQuery.get_data`.
+
+    Returns
+    -------
+    dfs
+        The data of each query in ``queries``.
+    """
+    merged, indices = merge_queries(queries)
+    results = [q.get_data(client, cache) for q in merged]
+
+    dfs = []
+    for query, i in zip(queries, indices):
+        df = results[i]
+        if isinstance(query, CubeQuery) and merged[i].measures != query.measures:
+            serialized = query.serialize(include_computed=False)
+            df = df.reindex(columns=[*serialized.get('dimensions', []), *serialized.get('measures', [])])
+        else:
+            df = df.copy(deep=False)
+        if include_computed:
+            df = query.add_computed(df)
+        dfs.append(df)
+    return dfs
@@ -1,13 +1,17 @@
+from copy import deepcopy
 from dataclasses import dataclass, field
-from typing import Optional, TYPE_CHECKING
+from typing import Iterable, Iterator, Optional, TYPE_CHECKING, Union
 from uuid import uuid4
 
-from .api import xmiddle
-from .notebook import render_component
-from .utils import insert, merge, AsSomethingMixin, MergeWithBase
+from .api import resolve_client
+from .cube import load_queries
+from .export import dashboard_html, write_html
+from .instrument import span
+from .notebook import RENDERERS, render_error, render_placeholder
+from .utils import content_hash, insert, json_dumps, merge, yaml_load, yaml_load_all, AsSomethingMixin, MergeWithBase
 
 if TYPE_CHECKING:
-    from .api import XMiddleService
+    from .api import AsyncXMiddleService, XMiddleService
     from .cube import BaseCubeQuery
 
 
@@ -32,6 +36,43 @@ class BaseComponent(AsSomethingMixin):
             return Dashboard(components=[self, other])
         return NotImplemented
 
+    @property
+    def content_hash(self) -> str:
+        """Hash of the serialized component, see :func:`~pytrevl.utils.content_hash`."""
+        return content_hash(self.serialize())
+
+
+class _TrackedDict(dict):
+    """``dict`` calling ``on_change()`` whenever it is modified."""
+    def __init__(self, data, on_change):
+        super().__init__(data)
+        self.on_change = on_change
+
+    def __reduce__(self):
+        # Pickled and copied as plain dict, the owner wraps it again, see
+        # QueryingKwargsComponent.__setstate__
+        return (dict, (dict(self),))
+
+    def _modifies(name):
+        method = getattr(dict, name)
+        def wrapper(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            self.on_change()
+            return result
+        wrapper.__name__ = name
+        return wrapper
+
+    __setitem__ = _modifies('__setitem__')
+    __delitem__ = _modifies('__delitem__')
+    __ior__ = _modifies('__ior__')
+    clear = _modifies('clear')
+    pop = _modifies('pop')
+    popitem = _modifies('popitem')
+    setdefault = _modifies('setdefault')
+    update = _modifies('update')
+    del _modifies
+
+
 class QueryingKwargsComponent(BaseComponent, metaclass=MergeWithBase):
     """Base class for creating component from kwargs with easy composition of sub-classes.
 
@@ -44,17 +85,47 @@ class QueryingKwargsComponent(BaseComponent, metaclass=MergeWithBase):
           # ...
         display:
           # ...
+
+    The result of :meth:`serialize` is cached until ``id``, ``kwargs``,
+    ``custom`` (via ``component[path] = value``) or the query changes. It is
+    shared between callers and must not be modified.
     """
     type: str
     _default: dict ={}
     _kw_paths: dict[str, str] = {}
+    # Changing these attributes invalidates the cached serialization
+    _tracked_attributes = frozenset({'id', 'kwargs', 'custom', 'query'})
+    _serialized: Optional[tuple] = None
+    _content_hash: Optional[str] = None
 
     def __init__(self, query: 'BaseCubeQuery', id: Optional[str]=None, **kwargs):
         super().__init__(id)
+        for name in kwargs:
+            if name not in self.kw_plan:
+                raise self._unknown_kwarg(name)
         self.query = query
         self.kwargs = kwargs
         self.custom = {}
 
+    def __setattr__(self, name, value):
+        if name == 'kwargs':
+            value = _TrackedDict(value, self._invalidate)
+        super().__setattr__(name, value)
+        if name in self._tracked_attributes:
+            self._invalidate()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Track the kwargs of the copy and drop the cached serialization
+        self.kwargs = self.kwargs
+
+    def _invalidate(self):
+        self._serialized = None
+        self._content_hash = None
+
+    def _unknown_kwarg(self, name):
+        return ValueError(f'{type(self).__name__} received unknown keyword argument {name!r}. Supported arguments are: {", ".join(sorted(self.kw_paths))}')
+
     def _filter_locals(self, l, filtered=None):
         """Internal helper to be used to update ``self.kwargs``.
 
@@ -77,19 +148,38 @@ class QueryingKwargsComponent(BaseComponent, metaclass=MergeWithBase):
     def __setitem__(self, path, value):
         self.custom = insert(value, path, self.custom)
 
+    @property
+    def content_hash(self) -> str:
+        serialized = self.serialize()
+        if self._content_hash is None:
+            self._content_hash = content_hash(serialized)
+        return self._content_hash
+
     def serialize(self):
+        # The query is serialized every time to notice in-place changes
+        query = self.query.serialize()
+        if self._serialized is not None and self._serialized[0] == query:
+            return self._serialized[1]
+
+        serialized = self._serialize(query)
+        # Copy the query for the comparison, it may share lists with the
+        # query object.
+        self._serialized = (deepcopy(query), serialized)
+        self._content_hash = None
+        return serialized
+
+    def _serialize(self, query):
         dynamic = {}
         for name, value in self.kwargs.items():
-            if name not in self.kw_paths:
-                raise ValueError(f'{type(self).__name__} received unknown keyword argument {name!r}. Supported arguments are: {", ".join(sorted(self.kw_paths))}')
-            dest = self.kw_paths[name]
-            dynamic = insert(value, dest, dynamic)
+            try:
+                dest = self.kw_plan[name]
+            except KeyError:
+                raise self._unknown_kwarg(name) from None
+            insert(value, dest, dynamic)
 
-        display = self.default
-        display = merge(display, dynamic)
-        display = merge(display, self.custom)
+        display = merge(self.default, dynamic, self.custom)
 
-        queries = [self.query.serialize()]
+        queries = [query]
         return {
             'type': self.type,
             'id': self.id,
@@ -104,6 +194,10 @@ class QueryingKwargsComponent(BaseComponent, metaclass=MergeWithBase):
         resp = Dashboard(components=[self]).render(*args, **kwargs)
         return resp["components"][0]
 
+    async def render_async(self, *args, **kwargs):
+        resp = await Dashboard(components=[self]).render_async(*args, **kwargs)
+        return resp["components"][0]
+
 
 @dataclass
 class Dashboard(AsSomethingMixin):
@@ -117,10 +211,97 @@ class Dashboard(AsSomethingMixin):
         if self.description:
             data['description'] = self.description
 
-        data['components'] = [c.serialize() for c in self.components]
+        with span('dashboard.serialize', components=len(self.components)):
+            data['components'] = [c.serialize() for c in self.components]
 
         return data
 
+    def _iter_json(self, indent=2, **dump_kw):
+        """Yield the JSON-serialized dashboard component by component."""
+        if indent is None:
+            newline, inner, separator = '', '', ', '
+        else:
+            newline = '\n' + ' ' * indent
+            inner = newline + ' ' * indent
+            separator = ','
+
+        yield '{'
+        if self.description:
+            yield f'{newline}"description": {json_dumps(self.description, **dump_kw)}{separator}'
+        yield f'{newline}"components": ['
+        for i, component in enumerate(self.components):
+            encoded = json_dumps(component.serialize(), indent=indent, **dump_kw)
+            if indent is not None:
+                encoded = encoded.replace('\n', inner)
+            yield f'{separator if i else ""}{inner}{encoded}'
+        if self.components:
+            yield newline
+        yield ']'
+        yield '\n}' if indent is not None else '}'
+
+    @property
+    def content_hash(self) -> str:
+        """Hash of the serialized dashboard, combining the cached hashes of
+        the components."""
+        return content_hash({
+            'description': self.description,
+            'components': [c.content_hash for c in self.components],
+        })
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Dashboard':
+        """Create a dashboard from serialized TREVL code.
+
+        The components are wrapped in :class:`~pytrevl.charts.CustomChart`
+        instances, i.e. their TREVL code is used as-is.
+        """
+        from .charts import CustomChart
+
+        return cls(
+            description=data.get('description', ''),
+            components=[CustomChart(c) for c in data.get('components', [])],
+        )
+
+    @classmethod
+    def from_yaml(cls, code) -> 'Dashboard':
+        """Create a dashboard from YAML code (a string or a file-like object)."""
+        return cls.from_dict(yaml_load(code))
+
+    @classmethod
+    def from_yaml_many(cls, paths: Iterable[str]) -> Iterator['Dashboard']:
+        """Lazily create dashboards from YAML files.
+
+        Each file may contain several YAML documents separated by ``---``.
+        Files are only opened and documents only parsed when the next
+        dashboard is requested, so e.g.::
+
+            >>> next(d for d in Dashboard.from_yaml_many(paths) if d.description == 'Sales')
+
+        stops parsing the library at the first match.
+        """
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                for data in yaml_load_all(f):
+                    if data is not None:
+                        yield cls.from_dict(data)
+
+    def get_data(self, client=None, cache=None, include_computed=False) -> dict:
+        """Load the data of all components' queries from Cube.js.
+
+        Duplicate queries are only loaded once and queries on the same cube
+        that just differ in their measures are loaded with a single request,
+        see :func:`~pytrevl.cube.merge_queries`. The parameters are passed
+        through to :meth:`~pytrevl.cube.BaseCubeQuery.get_data`.
+
+        Returns
+        -------
+        dfs
+            The data of each component with a query by the component's ID.
+        """
+        components = [c for c in self.components if getattr(c, 'query', None) is not None]
+        dfs = load_queries([c.query for c in components], client, cache, include_computed)
+        return {c.id: df for c, df in zip(components, dfs)}
+
     def __add__(self, other):
         if isinstance(other, Dashboard):
             return Dashboard(self.description, self.components + other.components)
@@ -142,15 +323,130 @@ class Dashboard(AsSomethingMixin):
             return self
         return NotImplemented
 
-    def render(self, api_client: 'XMiddleService'=None, **kwargs):
-        if api_client is None:
-            api_client = xmiddle()
+    def render(self, api_client: Union['XMiddleService', str, None]=None, split: bool=False, **kwargs):
+        """Render the dashboard through x-middle.
+
+        Parameters
+        ----------
+        api_client
+            The client to use or the name of a client configuration in
+            :data:`~pytrevl.api.clients`. Defaults to :func:`~pytrevl.api.xmiddle`.
+        split
+            If ``True``, render each component with a separate, cached
+            request, see :meth:`~pytrevl.api.XMiddleService.render_components`.
+        **kwargs
+            Passed through to the client.
+        """
+        api_client = resolve_client('xmiddle', api_client)
 
+        if split:
+            return api_client.render_components(self, **kwargs)
         return api_client(self, **kwargs)
 
-    def show(self, *args, **kwargs):
+    async def render_async(self, api_client: Union['AsyncXMiddleService', str, None]=None, **kwargs):
+        """Render the dashboard without blocking the event loop.
+
+        See :class:`~pytrevl.api.AsyncXMiddleService` for rendering many
+        dashboards concurrently.
+        """
+        api_client = resolve_client('xmiddle_async', api_client)
+
+        return await api_client(self, **kwargs)
+
+    def show(self, api_client: Union['XMiddleService', str, None]=None, split: bool=False, progressive: bool=False, renderer: str='shared', max_points: Optional[int]=None, **kwargs):
+        """Display the rendered dashboard in a notebook.
+
+        Parameters
+        ----------
+        api_client, split
+            See :meth:`render`.
+        progressive
+            If ``True``, the components are rendered concurrently with
+            separate requests (see
+            :meth:`~pytrevl.api.XMiddleService.iter_components`) and each is
+            displayed as soon as it arrives, with a placeholder until then.
+            Components failing to render show their error.
+        renderer
+            ``'shared'`` to display all components in one document loading
+            the Highcharts runtime once, or ``'iframe'`` for a separate
+            document per chart, see :mod:`pytrevl.notebook`.
+        max_points
+            If given, chart series with more points are downsampled for
+            display, see :func:`~pytrevl.downsample.downsample_chart`. Charts
+            with their own ``max_points`` use that instead.
+        **kwargs
+            Passed through to the client.
+        """
         from IPython.display import HTML
-        body = self.render(*args, **kwargs)
 
-        iframes = [render_component(comp) for comp in body['components']]
-        return HTML('\n'.join(iframes))
+        try:
+            render = RENDERERS[renderer]
+        except KeyError:
+            raise ValueError(f'Unknown renderer {renderer!r}. Available renderers are: {", ".join(RENDERERS)}') from None
+
+        if progressive:
+            return self._show_progressive(resolve_client('xmiddle', api_client), render, max_points, **kwargs)
+
+        body = self.render(api_client, split, **kwargs)
+        return HTML(render(self._downsample(body['components'], max_points)))
+
+    def to_html(self, path: Optional[str]=None, inline_assets: bool=True, asset_dir: Optional[str]=None, api_client: Union['XMiddleService', str, None]=None, max_points: Optional[int]=None, width: int=800, height: int=400, **kwargs) -> str:
+        """Render the dashboard once and export it as a static HTML document.
+
+        See :func:`~pytrevl.export.export_html` for exporting many dashboards
+        concurrently.
+
+        Parameters
+        ----------
+        path
+            If given, the document is written to this file.
+        inline_assets, asset_dir, width, height
+            See :func:`~pytrevl.export.html_document`.
+        api_client
+            See :meth:`render`.
+        max_points
+            See :meth:`show`.
+        **kwargs
+            Passed through to the client.
+
+        Returns
+        -------
+        document
+            The HTML document.
+        """
+        rendered = self.render(api_client, **kwargs)
+        document = dashboard_html(self, rendered, max_points, inline_assets=inline_assets, asset_dir=asset_dir, width=width, height=height)
+        if path is not None:
+            write_html(path, document)
+        return document
+
+    def _downsample(self, rendered: list[dict], max_points: Optional[int]) -> list[dict]:
+        """Downsample the rendered charts for display."""
+        limits = {c.id: getattr(c, 'max_points', None) or max_points for c in self.components}
+        if not any(limits.values()):
+            return rendered
+
+        from .downsample import downsample_chart
+        return [
+            downsample_chart(comp, limits[comp['id']])[0]
+            if comp.get('type') == 'chart' and limits.get(comp.get('id')) else comp
+            for comp in rendered
+        ]
+
+    def _show_progressive(self, api_client: 'XMiddleService', render, max_points: Optional[int]=None, **kwargs):
+        from IPython.display import HTML, display
+
+        handles = [
+            display(HTML(render_placeholder(c.id)), display_id=True)
+            for c in self.components
+        ]
+        for result in api_client.iter_components(self, **kwargs):
+            component = self.components[result.index]
+            if result.error is None:
+                try:
+                    content = render(self._downsample(result.response['components'], max_points))
+                except (KeyError, ValueError) as e:
+                    content = render_error(component.id, e)
+            else:
+                content = render_error(component.id, result.error)
+            handles[result.index].update(HTML(content))
@@ -0,0 +1,324 @@
+"""Reduce the number of data points of rendered charts.
+
+Line and area series are downsampled with Largest-Triangle-Three-Buckets
+(LTTB), which keeps the visual shape of a line with few points. Scatter and
+heatmap series are binned. Data points are also re-encoded from objects like
+``{"x": 1, "y": 2}`` into arrays like ``[1, 2]``, which Highcharts accepts
+and which are much smaller.
+
+    >>> chart, report = downsample_chart(chart.render(), max_points=2000)
+    >>> print(report)
+    Removed 98000 of 100000 points (98.0%) and 2.6 MB of 2.7 MB (96.3%)
+"""
+from dataclasses import dataclass
+from typing import Optional, TYPE_CHECKING
+
+from .instrument import span
+from .utils import json_dumpb
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Series types downsampled with LTTB
+LINE_TYPES = frozenset({'line', 'spline', 'area', 'areaspline'})
+# Series types downsampled by binning
+SCATTER_TYPES = frozenset({'scatter'})
+HEATMAP_TYPES = frozenset({'heatmap'})
+
+
+@dataclass
+class DownsampleReport:
+    """Points and bytes of a chart before and after downsampling."""
+    points_before: int = 0
+    points_after: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+    @property
+    def points_removed(self) -> int:
+        return self.points_before - self.points_after
+
+    @property
+    def bytes_removed(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    def __add__(self, other: 'DownsampleReport') -> 'DownsampleReport':
+        return DownsampleReport(
+            self.points_before + other.points_before,
+            self.points_after + other.points_after,
+            self.bytes_before + other.bytes_before,
+            self.bytes_after + other.bytes_after,
+        )
+
+    def __str__(self):
+        def share(part, total):
+            return f'{100 * part / total:.1f}%' if total else '0%'
+        return (
+            f'Removed {self.points_removed} of {self.points_before} points ({share(self.points_removed, self.points_before)}) '
+            f'and {self.bytes_removed / 1e6:.1f} MB of {self.bytes_before / 1e6:.1f} MB ({share(self.bytes_removed, self.bytes_before)})'
+        )
+
+
+def lttb(x: 'np.ndarray', y: 'np.ndarray', n_out: int) -> 'np.ndarray':
+    """Select ``n_out`` points of a line with Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept. The other points are split into
+    ``n_out - 2`` buckets and of each bucket the point spanning the largest
+    triangle with its neighbouring buckets is selected. To compute all
+    buckets at once, the triangles are spanned with the averages of both
+    neighbouring buckets instead of the point selected in the previous bucket
+    (as in the original, sequential algorithm).
+
+    Parameters
+    ----------
+    x, y
+        The coordinates of the points, ``x`` in ascending order.
+    n_out
+        The number of points to select, at least 3.
+
+    Returns
+    -------
+    indices
+        The indices of the selected points in ascending order.
+    """
+    import numpy as np
+
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Bucket boundaries of the inner points, plus the first and last point
+    # as buckets of their own
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    starts = np.concatenate(([0], edges[:-1], [n - 1]))
+    ends = np.concatenate(([1], edges[1:], [n]))
+    counts = ends - starts
+
+    with np.errstate(invalid='ignore'):
+        mean_x = np.add.reduceat(x, starts) / counts
+        mean_y = np.add.reduceat(np.nan_to_num(y), starts) / counts
+
+    # Anchors of the inner buckets: the averages of the previous and next
+    # bucket
+    inner = slice(starts[1], starts[-1])
+    bucket = np.repeat(np.arange(1, n_out - 1), counts[1:-1])
+    ax, ay = mean_x[bucket - 1], mean_y[bucket - 1]
+    cx, cy = mean_x[bucket + 1], mean_y[bucket + 1]
+    area = np.abs((ax - cx) * (y[inner] - ay) - (ax - x[inner]) * (cy - ay))
+    # Never select missing values if a bucket has other points
+    area = np.where(np.isnan(area), -1.0, area)
+
+    # The first point with the maximal area of each bucket
+    inner_starts = starts[1:-1] - starts[1]
+    maxima = np.maximum.reduceat(area, inner_starts)
+    candidates = np.flatnonzero(area == maxima[bucket - 1])
+    _, first = np.unique(bucket[candidates], return_index=True)
+    selected = candidates[first] + starts[1]
+    return np.concatenate(([0], selected, [n - 1]))
+
+
+def bin_points(x: 'np.ndarray', y: 'np.ndarray', max_points: int) -> 'np.ndarray':
+    """Select at most about ``max_points`` points of a scatter plot.
+
+    The plot area is split into a grid of ``max_points`` cells and the first
+    point of each non-empty cell is kept, so outliers stay visible.
+
+    Returns
+    -------
+    indices
+        The indices of the selected points in ascending order.
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= max_points:
+        return np.arange(len(x))
+    size = max(int(np.sqrt(max_points)), 1)
+
+    def cell(values):
+        low, high = np.nanmin(values), np.nanmax(values)
+        scaled = (values - low) / (high - low) * size if high > low else np.zeros_like(values)
+        return np.clip(np.nan_to_num(scaled), 0, size - 1).astype(np.intp)
+
+    _, first = np.unique(cell(x) * size + cell(y), return_index=True)
+    return np.sort(first)
+
+
+def bin_heatmap(x: 'np.ndarray', y: 'np.ndarray', value: 'np.ndarray', max_points: int) -> tuple[int, 'np.ndarray', 'np.ndarray', 'np.ndarray']:
+    """Merge the cells of a heatmap into larger cells of ``factor`` x
+    ``factor`` cells with the mean value, so that at most about
+    ``max_points`` cells remain.
+
+    Returns
+    -------
+    factor, x, y, value
+        The factor the cells were enlarged by and the centers and values of
+        the merged cells.
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    value = np.asarray(value, dtype=float)
+    factor = int(np.ceil(np.sqrt(len(x) / max_points)))
+    if factor <= 1:
+        return 1, x, y, value
+
+    bx, by = np.floor(x / factor), np.floor(y / factor)
+    cells, inverse = np.unique(np.stack([bx, by]), axis=1, return_inverse=True)
+    inverse = inverse.ravel()
+    valid = ~np.isnan(value)
+    sums = np.bincount(inverse, weights=np.where(valid, value, 0), minlength=cells.shape[1])
+    counts = np.bincount(inverse, weights=valid, minlength=cells.shape[1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    center = (factor - 1) / 2
+    return factor, cells[0] * factor + center, cells[1] * factor + center, means
+
+
+def _series_type(series: dict, rendered_chart: dict) -> Optional[str]:
+    from .charts import _chart_type
+
+    return series.get('type', _chart_type(rendered_chart))
+
+
+def _columns(data: list, keys: Optional[list]=None) -> Optional[dict]:
+    """The values of the points by key, ``None`` if the points cannot be
+    encoded as arrays (e.g. points with individual options)."""
+    if not data:
+        return None
+    first = data[0]
+    if isinstance(first, dict):
+        keys = tuple(first)
+        if any(not isinstance(p, dict) or tuple(p) != keys for p in data):
+            return None
+        if any(isinstance(v, (dict, list)) for v in first.values()):
+            return None
+        return {k: [p[k] for p in data] for k in keys}
+    if isinstance(first, (list, tuple)):
+        from .charts import _POINT_ARRAY_KEYS
+
+        keys = keys or _POINT_ARRAY_KEYS.get(len(first))
+        if keys is None or any(len(p) != len(keys) for p in data):
+            return None
+        return dict(zip(keys, (list(c) for c in zip(*data))))
+    return {'y': list(data)}
+
+
+def _take(columns: dict, indices) -> dict:
+    return {k: [values[i] for i in indices] for k, values in columns.items()}
+
+
+def _encode(series: dict, columns: dict):
+    """Store ``columns`` as compact data points in ``series``."""
+    from .charts import _POINT_ARRAY_KEYS
+
+    keys = tuple(columns)
+    if keys == ('y',):
+        series['data'] = columns['y']
+        series.pop('keys', None)
+        return
+    series['data'] = [list(p) for p in zip(*columns.values())]
+    if _POINT_ARRAY_KEYS.get(len(keys)) == keys:
+        series.pop('keys', None)
+    else:
+        series['keys'] = list(keys)
+
+
+def _is_numeric(values: list) -> bool:
+    return all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values)
+
+
+def downsample_series(series: dict, series_type: Optional[str], max_points: int, categorical: bool=False) -> dict:
+    """Downsample and compactly encode one series, see
+    :func:`downsample_chart`.
+
+    Returns
+    -------
+    series
+        A new series, or ``series`` itself if it cannot be downsampled.
+    """
+    import numpy as np
+
+    from .charts import _point_array_keys
+
+    data = series.get('data') or []
+    keys = None
+    if data and isinstance(data[0], (list, tuple)):
+        keys = _point_array_keys(series, len(data[0]), series_type)
+    columns = _columns(data, keys)
+    if columns is None:
+        return series
+    n = len(next(iter(columns.values())))
+    series = dict(series)
+    if n > max_points and 'x' not in columns and series_type in LINE_TYPES:
+        # Points given as y-values only are evenly spaced. Add their
+        # x-values as they are not evenly spaced after downsampling.
+        start, interval = series.pop('pointStart', 0), series.pop('pointInterval', 1)
+        columns = {'x': (start + np.arange(n) * interval).tolist(), **columns}
+    x = columns.get('x')
+
+    if n > max_points and x is not None and 'y' in columns and _is_numeric(x) and _is_numeric(columns['y']):
+        y = np.array(columns['y'], dtype=float)
+        if series_type in LINE_TYPES:
+            columns = _take(columns, lttb(x, y, max_points))
+        elif series_type in SCATTER_TYPES:
+            columns = _take(columns, bin_points(x, y, max_points))
+        elif series_type in HEATMAP_TYPES and not categorical and 'value' in columns and _is_numeric(columns['value']):
+            factor, bx, by, value = bin_heatmap(x, y, columns['value'], max_points)
+            if factor > 1:
+                columns = {
+                    'x': bx.tolist(),
+                    'y': by.tolist(),
+                    'value': [None if np.isnan(v) else v for v in value.tolist()],
+                }
+                series['colsize'] = series.get('colsize', 1) * factor
+                series['rowsize'] = series.get('rowsize', 1) * factor
+    _encode(series, columns)
+    return series
+
+
+def downsample_chart(rendered_chart: dict, max_points: int=2000) -> tuple[dict, DownsampleReport]:
+    """Reduce the data points of the series of a rendered chart.
+
+    Line and area series with more than ``max_points`` points are
+    downsampled with :func:`lttb`, scatter series with :func:`bin_points`
+    and heatmaps on non-categorical axes with :func:`bin_heatmap`. The
+    points of all series are encoded as arrays where possible.
+
+    Parameters
+    ----------
+    rendered_chart
+        The chart as rendered by x-middle. It is not changed.
+    max_points
+        The maximum number of points per series.
+
+    Returns
+    -------
+    chart, report
+        The downsampled chart and how many points and bytes were removed.
+    """
+    report = DownsampleReport()
+    series = rendered_chart.get('series')
+    if not isinstance(series, list):
+        return rendered_chart, report
+
+    with span('chart.downsample') as s:
+        categorical = any(
+            isinstance(rendered_chart.get(axis), dict) and rendered_chart[axis].get('categories') is not None
+            for axis in ('xAxis', 'yAxis')
+        )
+        chart = dict(rendered_chart)
+        chart['series'] = [
+            downsample_series(ser, _series_type(ser, rendered_chart), max_points, categorical)
+            for ser in series
+        ]
+        report.points_before = sum(len(ser.get('data') or []) for ser in series)
+        report.points_after = sum(len(ser.get('data') or []) for ser in chart['series'])
+        report.bytes_before = len(json_dumpb(series))
+        report.bytes_after = len(json_dumpb(chart['series']))
+        s.set(points_removed=report.points_removed, bytes_removed=report.bytes_removed)
+    return chart, report
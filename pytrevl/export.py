@@ -0,0 +1,179 @@
+"""Export rendered dashboards as static HTML files.
+
+A dashboard is rendered through x-middle once and written as one
+self-contained file, which can be served without calling x-middle for each
+view. The Highcharts runtime is inlined from a local asset directory (see
+:func:`~pytrevl.notebook.fetch_assets`), so the files do not depend on a CDN,
+and data repeated across components is stored only once per file.
+
+    >>> dashboard.to_html('report.html', asset_dir='assets')
+    >>> export_html(dashboards, [f'reports/{i}.html' for i in range(len(dashboards))], asset_dir='assets')
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+from typing import Iterable, Optional, Sequence, TYPE_CHECKING, Union
+
+from .api import RenderBatch, RenderResult, resolve_client
+from .hedging import deadline_at
+from .instrument import span
+from .notebook import HIGHCHARTS_SCRIPTS, _script_tags, _shared_document, inline_script_tags
+
+if TYPE_CHECKING:
+    from .api import XMiddleService
+    from .dashboard import Dashboard
+
+# Environment variable with the default asset directory
+ASSET_DIR_ENV = 'PYTREVL_ASSET_DIR'
+
+
+def _asset_dir(asset_dir: Optional[str]) -> str:
+    asset_dir = asset_dir or os.environ.get(ASSET_DIR_ENV)
+    if not asset_dir:
+        raise ValueError(f'No asset directory given. Pass asset_dir or set {ASSET_DIR_ENV}, or use inline_assets=False.')
+    return asset_dir
+
+
+def html_document(components: list[dict], title: str='', inline_assets: bool=True, asset_dir: Optional[str]=None, width: int=800, height: int=400) -> str:
+    """Build a static HTML document displaying ``components``.
+
+    Parameters
+    ----------
+    components
+        The rendered components, e.g. the ``'components'`` of a rendered
+        dashboard.
+    title
+        The title of the document.
+    inline_assets
+        If ``True``, the Highcharts scripts are read from ``asset_dir`` and
+        embedded in the document, otherwise they are loaded from the CDN.
+    asset_dir
+        The directory with the scripts, see
+        :func:`~pytrevl.notebook.fetch_assets`. Defaults to the environment
+        variable ``PYTREVL_ASSET_DIR``.
+    width, height
+        The size of each chart in pixels.
+    """
+    if inline_assets:
+        scripts = inline_script_tags(_asset_dir(asset_dir))
+    else:
+        scripts = _script_tags(HIGHCHARTS_SCRIPTS)
+    return _shared_document(components, width, height, scripts, title)
+
+
+def write_html(path: Union[str, os.PathLike], document: str):
+    """Write ``document`` to ``path``, replacing the file atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    # Write to a temporary file first so that a web server never serves
+    # partial files.
+    f = NamedTemporaryFile('w', encoding='utf-8', dir=directory, suffix='.tmp', delete=False)
+    try:
+        with f:
+            f.write(document)
+        os.replace(f.name, path)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+
+
+def dashboard_html(dashboard: 'Dashboard', rendered: dict, max_points: Optional[int]=None, **kwargs) -> str:
+    """The static HTML document of a rendered dashboard, see
+    :func:`html_document`.
+
+    Parameters
+    ----------
+    dashboard
+        The dashboard.
+    rendered
+        The dashboard as rendered by x-middle.
+    max_points
+        If given, chart series with more points are downsampled, see
+        :meth:`~pytrevl.dashboard.Dashboard.show`.
+    **kwargs
+        Passed through to :func:`html_document`.
+    """
+    with span('dashboard.export', components=len(rendered['components'])) as s:
+        document = html_document(dashboard._downsample(rendered['components'], max_points), dashboard.description, **kwargs)
+        s.set(bytes=len(document))
+    return document
+
+
+def _export_one(api_client: 'XMiddleService', index: int, dashboard: 'Dashboard', path, render_kw: dict, html_kw: dict) -> RenderResult:
+    result = api_client._render_one(index, dashboard, **render_kw)
+    if result.ok:
+        start = perf_counter()
+        try:
+            write_html(path, dashboard_html(dashboard, result.response, **html_kw))
+        except (OSError, ValueError) as e:
+            # E.g. unwritable paths or unknown component types
+            result.error = e
+        result.elapsed += perf_counter() - start
+    return result
+
+
+def export_html(
+    dashboards: Iterable['Dashboard'],
+    paths: Sequence[Union[str, os.PathLike]],
+    api_client: Union['XMiddleService', str, None]=None,
+    max_workers: int=8,
+    inline_assets: bool=True,
+    asset_dir: Optional[str]=None,
+    max_points: Optional[int]=None,
+    width: int=800,
+    height: int=400,
+    deadline: Optional[float]=None,
+    **kwargs,
+) -> RenderBatch:
+    """Render many dashboards concurrently and write each as a static HTML
+    file.
+
+    Like :meth:`~pytrevl.api.XMiddleService.render_many`, failing renders do
+    not abort the batch. No file is written for them. Errors building or
+    writing a file are reported in the :class:`~pytrevl.api.RenderResult` of
+    its dashboard as well.
+
+    Parameters
+    ----------
+    dashboards
+        The dashboards to export.
+    paths
+        The file to write for each dashboard.
+    api_client
+        The client to use or the name of a client configuration in
+        :data:`~pytrevl.api.clients`. Defaults to :func:`~pytrevl.api.xmiddle`.
+    max_workers
+        The maximum number of dashboards exported at the same time.
+    inline_assets, asset_dir, width, height
+        See :func:`html_document`.
+    max_points
+        See :func:`dashboard_html`.
+    deadline
+        If given, the maximum time in seconds for rendering the whole batch.
+    **kwargs
+        Passed through to the client, e.g. ``event`` or ``state``.
+
+    Returns
+    -------
+    batch
+        The results of all renders together with timing information.
+    """
+    dashboards = list(dashboards)
+    if len(dashboards) != len(paths):
+        raise ValueError(f'Got {len(dashboards)} dashboards but {len(paths)} paths')
+    api_client = resolve_client('xmiddle', api_client)
+    if inline_assets:
+        # Fail before rendering anything if the assets are missing
+        asset_dir = _asset_dir(asset_dir)
+        inline_script_tags(asset_dir)
+
+    start = perf_counter()
+    kwargs['deadline'] = deadline_at(deadline)
+    html_kw = dict(max_points=max_points, inline_assets=inline_assets, asset_dir=asset_dir, width=width, height=height)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pytrevl-export') as pool:
+        futures = [
+            pool.submit(_export_one, api_client, i, dashboard, path, kwargs, html_kw)
+            for i, (dashboard, path) in enumerate(zip(dashboards, paths))
+        ]
+        results = [f.result() for f in futures]
+    return RenderBatch(results, perf_counter() - start)
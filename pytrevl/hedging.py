@@ -0,0 +1,108 @@
+"""Latency tracking, deadlines and request hedging for the API clients."""
+from bisect import bisect_left
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Optional, Union
+
+# Timeout in seconds, either for connecting and reading or as tuple
+# ``(connect, read)``.
+Timeout = Union[None, float, tuple[float, float]]
+
+
+class LatencyHistogram:
+    """Thread-safe histogram of request latencies.
+
+    Latencies are counted in buckets growing by ``growth`` from ``minimum``
+    up to ``maximum`` seconds, i.e. percentiles have a relative error of at
+    most ``growth - 1``.
+    """
+    def __init__(self, minimum: float=0.001, maximum: float=300.0, growth: float=1.1):
+        bounds = [minimum]
+        while bounds[-1] < maximum:
+            bounds.append(bounds[-1] * growth)
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self._lock = Lock()
+
+    def record(self, seconds: float):
+        i = bisect_left(self.bounds, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The latency in seconds below which a fraction ``q`` of requests
+        finished, or ``None`` if nothing was recorded yet."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for i, n in enumerate(self.counts):
+                seen += n
+                if seen >= rank and n:
+                    return self.bounds[min(i, len(self.bounds) - 1)]
+        return self.bounds[-1]
+
+
+@dataclass
+class HedgePolicy:
+    """When to send a second, identical request for a slow render.
+
+    If a request has not finished after the ``percentile`` latency of the
+    previous requests, a second request is sent and whichever finishes first
+    is used.
+    """
+    # Percentile of the latency after which the request is hedged
+    percentile: float = 0.95
+    # Minimum number of recorded latencies before requests are hedged
+    min_samples: int = 20
+    # Lower bound for the hedge delay in seconds
+    min_delay: float = 0.01
+
+    def delay(self, latency: LatencyHistogram) -> Optional[float]:
+        """The hedge delay in seconds, ``None`` if too few latencies were
+        recorded."""
+        if latency.count < self.min_samples:
+            return None
+        return max(latency.percentile(self.percentile), self.min_delay)
+
+
+class DeadlineExceeded(TimeoutError):
+    """A request did not finish before its deadline."""
+
+
+def deadline_at(deadline: Optional[float]) -> Optional[float]:
+    """Convert a deadline in seconds from now into a :func:`time.monotonic`
+    timestamp."""
+    return None if deadline is None else monotonic() + deadline
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left until the :func:`time.monotonic` timestamp ``deadline``.
+
+    Raises
+    ------
+    DeadlineExceeded
+        If the deadline passed.
+    """
+    if deadline is None:
+        return None
+    left = deadline - monotonic()
+    if left <= 0:
+        raise DeadlineExceeded('Deadline exceeded')
+    return left
+
+
+def cap_timeout(timeout: Timeout, deadline: Optional[float]) -> Timeout:
+    """Shorten a request timeout to end no later than ``deadline``."""
+    left = remaining(deadline)
+    if left is None:
+        return timeout
+    if timeout is None:
+        return left
+    if isinstance(timeout, tuple):
+        return tuple(min(t, left) for t in timeout)
+    return min(timeout, left)
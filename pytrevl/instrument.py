@@ -0,0 +1,245 @@
+"""Timing spans for the hot paths of pytrevl.
+
+Serializing dashboards, rendering them through x-middle and loading and
+extracting data emit :class:`Span` objects to the registered listeners,
+e.g. to find out where the time of a slow dashboard goes::
+
+    >>> from pytrevl.instrument import Aggregator
+    >>> with Aggregator() as stats:
+    ...     dashboard.render()
+    >>> print(stats.report())
+
+Any callable accepting a :class:`Span` can be registered with
+:func:`add_listener`, e.g. to forward spans to a tracing system. Without
+listeners, :func:`span` returns a shared no-op object, so instrumentation
+costs a single check.
+
+Emitted spans
+-------------
+``dashboard.serialize``
+    :meth:`~pytrevl.dashboard.Dashboard.serialize`, attribute
+    ``components``.
+``xmiddle.render``
+    :meth:`~pytrevl.api.XMiddleService.__call__`, attributes
+    ``request_bytes``, ``response_bytes`` and ``status``, containing
+``xmiddle.encode``
+    encoding (and compressing) the request body,
+``xmiddle.request``
+    the HTTP round trip, including retries,
+``xmiddle.decode``
+    decoding the JSON response.
+``cube.get_data``
+    :meth:`~pytrevl.cube.BaseCubeQuery.get_data`, attributes ``rows`` and
+    ``cached``, containing
+``cube.load``
+    the Cube.js request,
+``cube.to_frame``
+    building the data frame.
+``chart.get_data``
+    :meth:`~pytrevl.charts.BaseChart.get_data`, attribute ``rows``,
+    containing the render and
+``chart.extract``
+    extracting the data frame from the rendered chart.
+``chart.downsample``
+    :func:`~pytrevl.downsample.downsample_chart`, attributes
+    ``points_removed`` and ``bytes_removed``.
+"""
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Optional
+
+# Registered listeners. Replaced instead of modified, so it can be iterated
+# without locking.
+_listeners: tuple = ()
+_listeners_lock = Lock()
+
+_current: ContextVar[Optional['Span']] = ContextVar('pytrevl_span', default=None)
+
+
+@dataclass
+class Span:
+    """A timed stage.
+
+    Attributes
+    ----------
+    name
+        The name of the stage, see the module documentation.
+    parent
+        The name of the enclosing span in the same thread, if any.
+    start
+        The :func:`time.perf_counter` timestamp of the start.
+    duration
+        The duration in seconds.
+    attributes
+        Details of the stage, e.g. sizes or row counts.
+    error
+        The name of the exception raised in the span, if any.
+    """
+    name: str
+    parent: Optional[str] = None
+    start: float = 0.0
+    duration: float = 0.0
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, **attributes):
+        """Add attributes to the span."""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current.get()
+        self.parent = parent.name if parent else None
+        self._token = _current.set(self)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = perf_counter() - self.start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        for listener in _listeners:
+            listener(self)
+
+
+class _NoopSpan:
+    """Span used while no listener is registered."""
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **attributes):
+    """Context manager timing the stage ``name``.
+
+    Yields the :class:`Span`, whose :meth:`~Span.set` adds attributes known
+    only at the end of the stage.
+    """
+    if not _listeners:
+        return _NOOP
+    return Span(name, attributes=attributes)
+
+
+def current_span():
+    """The innermost running span of this thread (or task), e.g. to add
+    attributes to it from a nested function."""
+    return _current.get() or _NOOP
+
+
+def enabled() -> bool:
+    """Whether any listener is registered."""
+    return bool(_listeners)
+
+
+def add_listener(listener: Callable[[Span], None]):
+    """Call ``listener`` with every finished span.
+
+    Listeners are called in the thread that ran the span and must be
+    thread-safe.
+    """
+    global _listeners
+    with _listeners_lock:
+        _listeners = _listeners + (listener,)
+
+
+def remove_listener(listener: Callable[[Span], None]):
+    global _listeners
+    with _listeners_lock:
+        _listeners = tuple(l for l in _listeners if l != listener)
+
+
+@dataclass
+class StageStats:
+    """Aggregated spans of one stage."""
+    count: int = 0
+    errors: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    # Sums of the numeric attributes
+    attributes: dict = field(default_factory=dict)
+    # Counts of the values of other attributes, e.g. ``{'status': {200: 3}}``
+    values: dict = field(default_factory=dict)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Aggregator:
+    """Listener summing up the spans of each stage.
+
+    Numeric attributes are summed up, the values of other attributes (and
+    of the attributes in :attr:`categorical`) are counted.
+
+    Used as context manager, it is registered on entering and removed on
+    exiting.
+    """
+    categorical = frozenset({'status'})
+
+    def __init__(self):
+        self.stages: dict[str, StageStats] = {}
+        self._lock = Lock()
+
+    def __call__(self, span: Span):
+        with self._lock:
+            stats = self.stages.get(span.name)
+            if stats is None:
+                stats = self.stages[span.name] = StageStats()
+            stats.count += 1
+            stats.total += span.duration
+            stats.max = max(stats.max, span.duration)
+            if span.error:
+                stats.errors += 1
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and key not in self.categorical:
+                    stats.attributes[key] = stats.attributes.get(key, 0) + value
+                else:
+                    counts = stats.values.setdefault(key, {})
+                    counts[value] = counts.get(value, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+
+    def report(self) -> str:
+        """A table of the stages, slowest first."""
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1].total, reverse=True)
+        width = max([len(name) for name, _ in stages] + [5])
+        lines = [f'{"stage":<{width}} {"count":>6} {"total ms":>10} {"mean ms":>9} {"max ms":>9}  attributes']
+        for name, stats in stages:
+            attributes = [f'{k}={v:g}' for k, v in sorted(stats.attributes.items())]
+            attributes += [
+                f'{k}={"/".join(f"{value}:{n}" for value, n in counts.items())}'
+                for k, counts in sorted(stats.values.items())
+            ]
+            if stats.errors:
+                attributes.insert(0, f'errors={stats.errors}')
+            attributes = ', '.join(attributes)
+            lines.append(
+                f'{name:<{width}} {stats.count:>6} {stats.total * 1000:>10.2f} '
+                f'{stats.mean * 1000:>9.2f} {stats.max * 1000:>9.2f}  {attributes}'
+            )
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.report()
+
+    def __enter__(self):
+        add_listener(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_listener(self)
@@ -1,6 +1,19 @@
-"""Display a single Highcharts chart in an IFrame."""
+"""Display rendered components in notebooks.
+
+Two renderers are available, see :data:`RENDERERS`:
+
+``'shared'``
+    All components in one IFrame loading the Highcharts runtime once. Charts
+    are only drawn when they scroll into view.
+``'iframe'``
+    One IFrame with its own Highcharts runtime per chart.
+"""
+from functools import lru_cache
 import html
 import json
+import os
+
+from .utils import json_dumps
 
 def render_component(comp, *args, **kwargs):
     if comp['type'] == 'chart':
@@ -53,6 +66,25 @@ def render_chart(chart_options, width=800, height=400, template=None):
     src_doc = html.escape(page_src).replace('\n', ' ')
     return f"""<iframe width={width} height={height} srcdoc="{src_doc}"></iframe>"""
 
+_placeholder_template = """
+<div style="width:{width}px;height:{height}px;display:flex;align-items:center;justify-content:center;border:1px dashed #ccc;color:#888;font-family:sans-serif">
+  Rendering {id}...
+</div>"""
+
+_error_template = """
+<div style="width:{width}px;padding:1em;border:1px solid #e88;background:#fee;color:#a00;font-family:sans-serif">
+  <strong>Rendering {id} failed</strong>
+  <pre style="white-space:pre-wrap">{error}</pre>
+</div>"""
+
+def render_placeholder(component_id, width=800, height=400):
+    """Build a placeholder shown until a component is rendered."""
+    return _placeholder_template.format(id=html.escape(str(component_id)), width=width, height=height)
+
+def render_error(component_id, error, width=800):
+    """Build the message for a component that failed to render."""
+    return _error_template.format(id=html.escape(str(component_id)), error=html.escape(str(error)), width=width)
+
 def render_score(comp):
     defaults = {
         'unit': 'no-unit',
@@ -60,3 +92,233 @@ def render_score(comp):
         'text': 'no-text',
     }
     return _score_template.format(**{**defaults, **comp})
+
+# Scripts of the Highcharts runtime used by the shared renderer
+HIGHCHARTS_SCRIPTS = [
+    'https://code.highcharts.com/6/highcharts.js',
+    'https://code.highcharts.com/6/highcharts-more.js',
+    'https://code.highcharts.com/6/modules/heatmap.js',
+    'https://code.highcharts.com/6/modules/exporting.js',
+]
+
+_shared_template = """<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <meta charset="utf-8" />
+    <title>{title}</title>
+    {scripts}
+    <style>
+      body {{ margin: 0; padding: 0; font-family: sans-serif; }}
+      .pytrevl-component {{ margin-bottom: 8px; }}
+      .pytrevl-chart {{ width: {width}px; height: {height}px; }}
+    </style>
+  </head>
+  <body>
+    {containers}
+    <script type="application/json" id="pytrevl-options">{options}</script>
+    <script type="application/json" id="pytrevl-shared">{shared}</script>
+    <script>
+      (function() {{
+        var options = JSON.parse(document.getElementById('pytrevl-options').textContent);
+        // Data used by several charts is stored once and referenced
+        var shared = JSON.parse(document.getElementById('pytrevl-shared').textContent);
+        function resolve(value) {{
+          return value && value.$shared !== undefined ? shared[value.$shared].slice() : value;
+        }}
+        function axes(value) {{
+          return Array.isArray(value) ? value : (value ? [value] : []);
+        }}
+        options.forEach(function(chart) {{
+          (chart.series || []).forEach(function(series) {{ series.data = resolve(series.data); }});
+          axes(chart.xAxis).concat(axes(chart.yAxis)).forEach(function(axis) {{
+            axis.categories = resolve(axis.categories);
+          }});
+        }});
+        function mount(el) {{
+          Highcharts.chart(el, options[el.getAttribute('data-chart')]);
+        }}
+        var charts = Array.prototype.slice.call(document.querySelectorAll('.pytrevl-chart'));
+        if ('IntersectionObserver' in window) {{
+          // Draw charts shortly before they scroll into view
+          var observer = new IntersectionObserver(function(entries) {{
+            entries.forEach(function(entry) {{
+              if (entry.isIntersecting) {{
+                observer.unobserve(entry.target);
+                mount(entry.target);
+              }}
+            }});
+          }}, {{ rootMargin: '200px' }});
+          charts.forEach(function(el) {{ observer.observe(el); }});
+        }} else {{
+          charts.forEach(mount);
+        }}
+        // Fit the IFrame to the content
+        try {{
+          window.frameElement.style.height = document.body.scrollHeight + 'px';
+        }} catch (e) {{}}
+      }})();
+    </script>
+  </body>
+</html>
+"""
+
+# Estimated height of a score component in pixels
+_SCORE_HEIGHT = 80
+
+def _script_tags(scripts):
+    return '\n    '.join(f'<script type="text/javascript" src="{html.escape(src)}"></script>' for src in scripts)
+
+def _json_for_script(data):
+    """JSON to embed in a ``<script>`` element."""
+    return json_dumps(data).replace('</', '<\\/')
+
+def render_shared(components, width=800, height=400, scripts=None):
+    """Build one IFrame displaying all ``components``.
+
+    The Highcharts runtime is loaded once for all charts, and each chart is
+    drawn when it scrolls into view.
+
+    Parameters
+    ----------
+    components
+        The rendered components, e.g. the ``'components'`` of a rendered
+        dashboard.
+    width, height
+        The size of each chart in pixels.
+    scripts
+        The URLs of the Highcharts scripts. Defaults to
+        :data:`HIGHCHARTS_SCRIPTS`.
+    """
+    page_src = _shared_document(components, width, height, _script_tags(HIGHCHARTS_SCRIPTS if scripts is None else scripts))
+    total_height = sum(
+        height + 8 if comp['type'] == 'chart' else _SCORE_HEIGHT
+        for comp in components
+    )
+    src_doc = html.escape(page_src).replace('\n', ' ')
+    return f"""<iframe width={width + 16} height={total_height} style="border:none" srcdoc="{src_doc}"></iframe>"""
+
+class _SharedData:
+    """Table of data stored once in a document, see :func:`_shared_document`."""
+    def __init__(self):
+        self.values = []
+        self._index = {}
+
+    def ref(self, value):
+        """Store ``value`` unless it is already stored and return a
+        reference to it."""
+        key = json_dumps(value)
+        i = self._index.get(key)
+        if i is None:
+            i = self._index[key] = len(self.values)
+            self.values.append(value)
+        return {'$shared': i}
+
+    def share(self, chart: dict) -> dict:
+        """Replace the series data and axis categories of a chart by
+        references."""
+        chart = dict(chart)
+        if isinstance(chart.get('series'), list):
+            chart['series'] = [
+                {**s, 'data': self.ref(s['data'])} if isinstance(s, dict) and isinstance(s.get('data'), list) else s
+                for s in chart['series']
+            ]
+        for key in ('xAxis', 'yAxis'):
+            axes = chart.get(key)
+            if isinstance(axes, dict):
+                chart[key] = self._share_axis(axes)
+            elif isinstance(axes, list):
+                chart[key] = [self._share_axis(a) for a in axes]
+        return chart
+
+    def _share_axis(self, axis):
+        if isinstance(axis, dict) and isinstance(axis.get('categories'), list):
+            return {**axis, 'categories': self.ref(axis['categories'])}
+        return axis
+
+def _shared_document(components, width, height, scripts, title=''):
+    """The HTML document of :func:`render_shared`, with the ``<script>``
+    elements ``scripts`` for the runtime.
+
+    Series data and axis categories used by several charts are stored only
+    once in the document.
+    """
+    containers = []
+    options = []
+    shared = _SharedData()
+    for comp in components:
+        if comp['type'] == 'chart':
+            containers.append(f'<div class="pytrevl-component pytrevl-chart" data-chart="{len(options)}"></div>')
+            options.append(shared.share(comp))
+        elif comp['type'] == 'score':
+            containers.append(f'<div class="pytrevl-component">{render_score(comp)}</div>')
+        else:
+            raise ValueError(f"Unknown component type {comp['type']!r}")
+    return _shared_template.format(
+        title=html.escape(title),
+        scripts=scripts,
+        width=width,
+        height=height,
+        containers='\n    '.join(containers),
+        options=_json_for_script(options),
+        shared=_json_for_script(shared.values),
+    )
+
+def asset_path(asset_dir, url):
+    """The path of the script ``url`` in ``asset_dir``, e.g.
+    ``<asset_dir>/highcharts.js``."""
+    return os.path.join(asset_dir, url.rsplit('/', 1)[-1])
+
+def fetch_assets(asset_dir, scripts=None):
+    """Download the Highcharts scripts into ``asset_dir``, for
+    :func:`inline_script_tags`.
+
+    Parameters
+    ----------
+    asset_dir
+        The directory to store the scripts in. It is created if missing.
+    scripts
+        The URLs of the scripts. Defaults to :data:`HIGHCHARTS_SCRIPTS`.
+    """
+    import requests
+
+    os.makedirs(asset_dir, exist_ok=True)
+    for url in HIGHCHARTS_SCRIPTS if scripts is None else scripts:
+        resp = requests.get(url, timeout=30)
+        resp.raise_for_status()
+        with open(asset_path(asset_dir, url), 'wb') as f:
+            f.write(resp.content)
+
+@lru_cache(maxsize=8)
+def _read_assets(asset_dir, scripts):
+    sources = []
+    for url in scripts:
+        path = asset_path(asset_dir, url)
+        try:
+            with open(path, encoding='utf-8') as f:
+                sources.append(f.read())
+        except FileNotFoundError:
+            raise FileNotFoundError(f'Missing asset {path!r}. Use pytrevl.notebook.fetch_assets() to download the scripts.') from None
+    return sources
+
+def inline_script_tags(asset_dir, scripts=None):
+    """``<script>`` elements containing the Highcharts scripts, read from
+    ``asset_dir`` (see :func:`fetch_assets`)."""
+    sources = _read_assets(asset_dir, tuple(HIGHCHARTS_SCRIPTS if scripts is None else scripts))
+    # A script must not contain its own end tag
+    return '\n    '.join(
+        '<script type="text/javascript">' + source.replace('</script', '<\\/script') + '</script>'
+        for source in sources
+    )
+
+def render_iframes(components, width=800, height=400):
+    """Build one IFrame per component, see :func:`render_component`."""
+    return '\n'.join(
+        render_component(comp, width, height) if comp['type'] == 'chart' else render_component(comp)
+        for comp in components
+    )
+
+# Renderers by name. Each builds the HTML for a list of rendered components.
+RENDERERS = {
+    'shared': render_shared,
+    'iframe': render_iframes,
+}
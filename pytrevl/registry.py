@@ -0,0 +1,181 @@
+"""Thread-safe registry of named API clients."""
+from dataclasses import dataclass, field
+from threading import Lock, RLock, local
+from typing import Any, Callable, Hashable, Iterable, Optional
+from weakref import WeakSet, finalize
+
+
+def close_client(client):
+    """Close ``client`` or, if it has no ``close()`` method, the
+    :class:`requests.Session` objects it holds."""
+    close = getattr(client, 'close', None)
+    if callable(close):
+        close()
+        return
+    for value in vars(client).values():
+        if type(value).__name__ == 'Session' and callable(getattr(value, 'close', None)):
+            value.close()
+
+
+class _ThreadClient:
+    """Holds the client of one thread and closes it when the thread ends,
+    i.e. when its thread-local storage is freed, or on :meth:`close`."""
+    __slots__ = ('client', 'close', '__weakref__')
+
+    def __init__(self, client):
+        self.client = client
+        self.close = finalize(self, close_client, client)
+
+
+@dataclass
+class _Entry:
+    factory: Callable[..., Any]
+    options: dict
+    per_thread: bool
+    # The client shared by all threads
+    shared: Any = None
+    # The clients of the threads, if per_thread
+    local: local = field(default_factory=local)
+    # The clients of the threads still running, to close them
+    threads: WeakSet = field(default_factory=WeakSet)
+    # The shared clients created, to close them
+    created: list = field(default_factory=list)
+    lock: Lock = field(default_factory=Lock)
+
+
+class ClientRegistry:
+    """Thread-safe registry of named client configurations.
+
+    Each configuration is identified by a kind, e.g. ``'xmiddle'`` or
+    ``'cube'``, and a name, so several endpoints of the same kind can be used
+    in one process. Clients are created on first use, either once and shared
+    by all threads or once per thread (``per_thread=True``), e.g. for
+    clients whose session must not be shared. Clients of a thread are
+    closed when the thread ends.
+
+    Parameters
+    ----------
+    factories
+        The default factory of each kind, called with the options of a
+        configuration to create a client.
+    per_thread
+        The kinds whose clients are created per thread by default.
+    """
+    def __init__(self, factories: Optional[dict[str, Callable[..., Any]]]=None, per_thread: Iterable[str]=()):
+        self.factories = dict(factories or {})
+        self.per_thread = frozenset(per_thread)
+        self._entries: dict[tuple[str, Hashable], _Entry] = {}
+        self._lock = RLock()
+
+    def _entry(self, kind: str, factory, per_thread: Optional[bool], options: dict) -> _Entry:
+        if per_thread is None:
+            per_thread = kind in self.per_thread
+        if factory is None:
+            try:
+                factory = self.factories[kind]
+            except KeyError:
+                raise ValueError(f'Unknown client kind {kind!r}. Known kinds are: {", ".join(sorted(self.factories))}') from None
+        return _Entry(factory, options, per_thread)
+
+    def register(self, kind: str, name: Hashable='default', factory: Optional[Callable[..., Any]]=None, per_thread: Optional[bool]=None, **options):
+        """Register the configuration ``name`` of ``kind``.
+
+        Clients of a previous configuration with the same name are closed.
+
+        Parameters
+        ----------
+        kind
+            The kind of client, e.g. ``'xmiddle'``.
+        name
+            The name of the configuration.
+        factory
+            Called with ``options`` to create a client. Defaults to the
+            factory of ``kind``.
+        per_thread
+            If ``True``, each thread gets its own client. Defaults to
+            whether ``kind`` is in :attr:`per_thread`.
+        options
+            Passed to ``factory``.
+        """
+        entry = self._entry(kind, factory, per_thread, options)
+        with self._lock:
+            previous = self._entries.get((kind, name))
+            self._entries[(kind, name)] = entry
+        if previous is not None:
+            self._close_entry(previous)
+
+    def setdefault(self, kind: str, name: Hashable='default', factory: Optional[Callable[..., Any]]=None, per_thread: Optional[bool]=None, **options):
+        """Get the client of ``name``, registering the configuration first if
+        ``name`` is not registered yet."""
+        with self._lock:
+            if (kind, name) not in self._entries:
+                self._entries[(kind, name)] = self._entry(kind, factory, per_thread, options)
+        return self.get(kind, name)
+
+    def get(self, kind: str, name: Hashable='default'):
+        """The client of the configuration ``name`` for the current thread.
+
+        Raises
+        ------
+        KeyError
+            If ``name`` is not registered.
+        """
+        with self._lock:
+            try:
+                entry = self._entries[(kind, name)]
+            except KeyError:
+                raise KeyError(f'No {kind} client registered as {name!r}') from None
+
+        if entry.per_thread:
+            holder = getattr(entry.local, 'client', None)
+            if holder is None:
+                holder = _ThreadClient(entry.factory(**entry.options))
+                entry.local.client = holder
+                with entry.lock:
+                    entry.threads.add(holder)
+            return holder.client
+
+        if entry.shared is None:
+            with entry.lock:
+                # Check again, another thread may have been faster
+                if entry.shared is None:
+                    entry.shared = entry.factory(**entry.options)
+                    entry.created.append(entry.shared)
+        return entry.shared
+
+    def __contains__(self, key: tuple[str, Hashable]) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def _close_entry(self, entry: _Entry):
+        with entry.lock:
+            created, entry.created = entry.created, []
+            threads, entry.threads = list(entry.threads), WeakSet()
+            entry.shared = None
+            entry.local = local()
+        for client in created:
+            close_client(client)
+        for holder in threads:
+            holder.close()
+
+    def close(self, kind: Optional[str]=None, name: Optional[Hashable]=None):
+        """Close the clients of all configurations, or only those of ``kind``
+        and/or ``name``.
+
+        The configurations stay registered, so new clients are created on
+        the next use.
+        """
+        with self._lock:
+            entries = [
+                entry for (k, n), entry in self._entries.items()
+                if (kind is None or k == kind) and (name is None or n == name)
+            ]
+        for entry in entries:
+            self._close_entry(entry)
+
+    def reset(self):
+        """Close all clients and remove all configurations."""
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            self._close_entry(entry)
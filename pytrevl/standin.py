@@ -0,0 +1,333 @@
+"""Local stand-in server for x-middle and Cube.js.
+
+The server answers the x-middle endpoints ``dashboards`` and
+``dashboards/status`` and Cube.js' ``load`` endpoint from a
+:class:`Recording`. Requests that are not recorded yet are forwarded to the
+real services (if configured) and their successful responses recorded, so a
+recording made once can be replayed without network access, e.g. in tests
+and benchmarks::
+
+    >>> with StandInServer(Recording('responses.json'), xmiddle_upstream='https://x-middle.example.com') as server:
+    ...     api = XMiddleService(server.url)
+    ...     api(dashboard)  # recorded on first use, replayed afterwards
+
+Latency and errors can be injected to measure client throughput and tail
+latency. Run ``python -m pytrevl.standin --help`` to start a server from the
+command line.
+"""
+from dataclasses import dataclass, field
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+from threading import Lock, Thread
+import time
+from typing import Callable, Optional, Union
+from urllib.parse import parse_qs, urlsplit
+
+from .utils import content_hash
+
+# Paths of the served endpoints
+XMIDDLE_RENDER = '/dashboards'
+XMIDDLE_STATUS = '/dashboards/status'
+CUBE_LOAD = '/cubejs-api/v1/load'
+
+
+class Recording:
+    """Responses by request, optionally stored in a JSON file.
+
+    Requests are identified by method, path and the parsed JSON payload, so
+    the formatting or compression of a request does not matter.
+
+    Parameters
+    ----------
+    path
+        The JSON file to load the responses from and save new responses to.
+    """
+    def __init__(self, path: Optional[str]=None):
+        self.path = path
+        self.responses = {}
+        self._lock = Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.responses = json.load(f)
+
+    @staticmethod
+    def key(method: str, path: str, payload) -> str:
+        return content_hash({'method': method, 'path': path, 'payload': payload})
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.responses.get(key)
+
+    def put(self, key: str, status: int, body):
+        with self._lock:
+            self.responses[key] = {'status': status, 'body': body}
+            if self.path:
+                tmp = f'{self.path}.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(self.responses, f)
+                os.replace(tmp, self.path)
+
+    def __len__(self):
+        return len(self.responses)
+
+
+@dataclass
+class StandInStats:
+    """Counters of a :class:`StandInServer`."""
+    requests: int = 0
+    replayed: int = 0
+    recorded: int = 0
+    # Upstream responses passed on without recording them
+    forwarded: int = 0
+    missing: int = 0
+    injected_errors: int = 0
+    # Number of requests by path
+    paths: dict = field(default_factory=dict)
+
+
+def _recordable(status: int, body) -> bool:
+    """Whether an upstream response is final and can be replayed.
+
+    Errors and Cube.js' "Continue wait" responses are transient, so they are
+    forwarded every time instead.
+    """
+    return 200 <= status < 300 and not (isinstance(body, dict) and body.get('error') == 'Continue wait')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: '_Server'
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _payload(self, url):
+        """The parsed JSON payload of the request."""
+        if self.command == 'GET':
+            query = parse_qs(url.query).get('query')
+            return json.loads(query[0]) if query else None
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        payload = json.loads(body) if body else None
+        if url.path.endswith(CUBE_LOAD) and isinstance(payload, dict) and 'query' in payload:
+            # Cube.js accepts the query as {"query": ...} in POST requests
+            payload = payload['query']
+        return payload
+
+    def _handle(self, method):
+        standin = self.server.standin
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/')
+        upstream = standin.upstream_for(path)
+        if upstream is False:
+            return self._respond(404, {'error': f'Unknown endpoint {path!r}'})
+
+        payload = self._payload(url)
+        key = Recording.key(method, path, payload)
+        standin.count('requests', path)
+        standin.sleep()
+
+        if standin.inject_error():
+            return self._respond(standin.error_status, {'error': 'Injected error'})
+
+        recorded = standin.recording.get(key)
+        if recorded is not None:
+            standin.count('replayed')
+            return self._respond(recorded['status'], recorded['body'])
+
+        if upstream is None:
+            standin.count('missing')
+            return self._respond(404, {'error': f'No recorded response for {method} {path}'})
+
+        status, body = standin.forward(upstream, method, path, payload, self.headers)
+        if _recordable(status, body):
+            standin.recording.put(key, status, body)
+            standin.count('recorded')
+        else:
+            standin.count('forwarded')
+        self._respond(status, body)
+
+    def _respond(self, status: int, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    standin: 'StandInServer'
+
+    def handle_error(self, request, client_address):
+        # Clients may close connections early, e.g. after a deadline
+        pass
+
+
+class StandInServer:
+    """Local stand-in for x-middle and Cube.js, see the module documentation.
+
+    Parameters
+    ----------
+    recording
+        The recorded responses. Defaults to an empty, in-memory recording.
+    xmiddle_upstream
+        The base URL of the real x-middle API (without ``'dashboards'``).
+        Unrecorded x-middle requests are forwarded there and recorded.
+    cube_upstream
+        The base URL of the real Cube.js server (without
+        ``'/cubejs-api/v1/load'``). Unrecorded Cube.js requests are forwarded
+        there and recorded.
+    timeout
+        The timeout of forwarded requests in seconds.
+    latency
+        Delay added to each response in seconds, or a function returning
+        the delay, e.g. ``lambda: random.lognormvariate(-3, 0.5)``.
+    error_rate
+        Fraction of requests answered with ``error_status`` instead.
+    error_status
+        The HTTP status of injected errors.
+    seed
+        Seed for the random error injection.
+    host, port
+        The address to listen on. Port ``0`` picks a free port.
+    """
+    def __init__(
+        self,
+        recording: Optional[Recording]=None,
+        xmiddle_upstream: Optional[str]=None,
+        cube_upstream: Optional[str]=None,
+        timeout: float=60.0,
+        latency: Union[float, Callable[[], float]]=0.0,
+        error_rate: float=0.0,
+        error_status: int=503,
+        seed: Optional[int]=None,
+        host: str='127.0.0.1',
+        port: int=0,
+    ):
+        self.recording = Recording() if recording is None else recording
+        self.xmiddle_upstream = xmiddle_upstream
+        self.cube_upstream = cube_upstream
+        self.timeout = timeout
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stats = StandInStats()
+        self._random = random.Random(seed)
+        self._lock = Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.standin = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """The base URL, to be used for both x-middle and Cube.js clients."""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def upstream_for(self, path: str):
+        """The upstream URL for ``path``, ``None`` if there is none and
+        ``False`` if ``path`` is not served."""
+        if path in (XMIDDLE_RENDER, XMIDDLE_STATUS):
+            return self.xmiddle_upstream
+        if path == CUBE_LOAD:
+            return self.cube_upstream
+        return False
+
+    def count(self, counter: str, path: Optional[str]=None):
+        with self._lock:
+            setattr(self.stats, counter, getattr(self.stats, counter) + 1)
+            if path is not None:
+                self.stats.paths[path] = self.stats.paths.get(path, 0) + 1
+
+    def sleep(self):
+        delay = self.latency() if callable(self.latency) else self.latency
+        if delay > 0:
+            time.sleep(delay)
+
+    def inject_error(self) -> bool:
+        with self._lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats.injected_errors += 1
+                return True
+        return False
+
+    def forward(self, upstream: str, method: str, path: str, payload, headers) -> tuple[int, object]:
+        """Send a request to the real service."""
+        import requests
+
+        url = upstream.rstrip('/') + path
+        forwarded = {k: v for k, v in headers.items() if k.lower() == 'authorization'}
+        if method == 'GET':
+            params = {'query': json.dumps(payload)} if payload is not None else None
+            resp = requests.get(url, params=params, headers=forwarded, timeout=self.timeout)
+        else:
+            resp = requests.post(url, json=payload, headers=forwarded, timeout=self.timeout)
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {'error': resp.text}
+        return resp.status_code, body
+
+    def start(self) -> 'StandInServer':
+        self._thread = Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Local stand-in server for x-middle and Cube.js.')
+    parser.add_argument('--recording', required=True, help='JSON file with recorded responses')
+    parser.add_argument('--xmiddle-upstream', help='Base URL of x-middle to record from')
+    parser.add_argument('--cube-upstream', help='Base URL of Cube.js to record from')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Timeout of forwarded requests in seconds')
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay of each response in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    server = StandInServer(
+        Recording(args.recording),
+        xmiddle_upstream=args.xmiddle_upstream,
+        cube_upstream=args.cube_upstream,
+        timeout=args.timeout,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        host=args.host,
+        port=args.port,
+    )
+    print(f'Serving on {server.url}')
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,57 +1,182 @@
 """Utility functions."""
 from copy import deepcopy
-from itertools import zip_longest
+from dataclasses import asdict, is_dataclass
+from functools import lru_cache
+import hashlib
+from itertools import chain, zip_longest
 import json
 from typing import Optional, Union
 
-import yaml
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
-class NoAliasDumper(yaml.SafeDumper):
-    """Stop PyYAML from using anchors and aliases during dump operation.
+@lru_cache(maxsize=None)
+def _no_alias_dumper():
+    # PyYAML is only imported when YAML is used. Use the LibYAML bindings if
+    # PyYAML was built with them.
+    import yaml
+
+    class NoAliasDumper(getattr(yaml, 'CSafeDumper', yaml.SafeDumper)):
+        """Stop PyYAML from using anchors and aliases during dump operation.
+        """
+        def ignore_aliases(self, data):
+            return True
+
+    return NoAliasDumper
+
+
+def _safe_loader():
+    import yaml
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def __getattr__(name):
+    if name == 'NoAliasDumper':
+        return _no_alias_dumper()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def yaml_load(stream):
+    """Load a YAML document like :func:`yaml.safe_load`, using LibYAML if
+    available."""
+    import yaml
+    return yaml.load(stream, Loader=_safe_loader())
+
+
+def yaml_load_all(stream):
+    """Lazily load all YAML documents in ``stream`` like
+    :func:`yaml.safe_load_all`, using LibYAML if available."""
+    import yaml
+    return yaml.load_all(stream, Loader=_safe_loader())
+
+
+def _json_default(obj):
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return asdict(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def json_dumps(data, indent: Optional[int]=None, **dump_kw) -> str:
+    """Encode ``data`` as JSON.
+
+    Uses ``orjson`` if it is installed and supports the requested format
+    (``indent`` of ``None`` or ``2`` and no other keyword arguments),
+    otherwise :func:`json.dumps`.
+    """
+    if orjson is not None and indent in (None, 2) and not dump_kw:
+        return json_dumpb(data, indent).decode()
+    dump_kw.setdefault('default', _json_default)
+    return json.dumps(data, indent=indent, **dump_kw)
+
+
+def json_dumpb(data, indent: Optional[int]=None) -> bytes:
+    """Encode ``data`` as UTF-8 encoded JSON.
+
+    Uses ``orjson`` if it is installed, otherwise :func:`json.dumps`.
     """
-    def ignore_aliases(self, data):
-        return True
+    if orjson is not None and indent in (None, 2):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_json_default, option=option)
+    return json.dumps(data, indent=indent, default=_json_default).encode()
+
 
+def content_hash(data) -> str:
+    """Stable hash of a data structure.
+
+    The hash only depends on the content of ``data``, e.g. the order of
+    keys in a ``dict`` does not matter.
+    """
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=_json_default)
+    return hashlib.sha256(encoded.encode()).hexdigest()
 
-def merge(a, b):
-    """Recursively merge 2 data structures.
 
-    ``b`` takes precedence over ``a``.
+# Types that are not copied when merging
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _copy(obj):
+    """Deep copy of ``obj``, short-cutting the types used in TREVL documents."""
+    if isinstance(obj, dict):
+        return {k: _copy(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_copy(v) for v in obj]
+    if isinstance(obj, _SCALARS):
+        return obj
+    return deepcopy(obj)
+
+
+def merge(*items):
+    """Recursively merge data structures.
+
+    Later items take precedence over earlier items, i.e. ``merge(a, b, c)``
+    is the same as ``merge(merge(a, b), c)``, but each node of the result is
+    built only once. Lists are merged element-wise.
 
     Returns
     -------
     merged
-        ``a`` recursively merged with ``b``
+        The items recursively merged, sharing no containers with the items.
     """
-    if type(a) != type(b):
-        raise ValueError(f'Can only merge same typed objects. Got: {type(a)} and {type(b)}')
-    if isinstance(a, dict):
+    first, *rest = items
+    for prev, item in zip(items, rest):
+        if type(prev) != type(item):
+            raise ValueError(f'Can only merge same typed objects. Got: {type(prev)} and {type(item)}')
+
+    if isinstance(first, dict):
+        if not rest:
+            return _copy(first)
         out = {}
-        for k in set(a) | set(b):
-            if k in a and k in b:
-                out[k] = merge(a[k], b[k])
-            elif k in a:
-                out[k] = deepcopy(a[k])
-            else:
-                out[k] = deepcopy(b[k])
+        for k in dict.fromkeys(chain.from_iterable(items)):
+            values = [item[k] for item in items if k in item]
+            out[k] = merge(*values) if len(values) > 1 else _copy(values[0])
 
-    elif isinstance(a, list):
+    elif isinstance(first, list):
+        if not rest:
+            return _copy(first)
         out = []
-        for ai, bi in zip_longest(a, b):
-            if ai is not None and bi is not None:
-                out.append(merge(ai, bi))
-            elif ai is not None:
-                out.append(deepcopy(ai))
+        for values in zip_longest(*items):
+            values = [v for v in values if v is not None]
+            if len(values) > 1:
+                out.append(merge(*values))
             else:
-                out.append(deepcopy(bi))
+                out.append(_copy(values[0]) if values else None)
     else:
-        out = b
+        out = items[-1]
 
     return out
 
 
-def insert(value, path: Union[str, list[str]], container: Optional[Union[dict, list]]=None):
+@lru_cache(maxsize=4096)
+def parse_path(path: str) -> tuple[Union[str, int], ...]:
+    """Split a dot-separated path into its parts.
+
+    Numeric parts are converted to ``int`` (i.e. list indices). The results
+    are cached.
+    """
+    return tuple(int(part) if part.isdigit() else part for part in path.split('.'))
+
+
+def _container_for(container, key):
+    """Check that ``key`` can be inserted into ``container`` or create one."""
+    if isinstance(key, int):
+        if container is None:
+            return []
+        if not isinstance(container, list):
+            raise ValueError(f'Cannot insert {str(key)!r} into {type(container)}')
+    else:
+        if container is None:
+            return {}
+        if not isinstance(container, dict):
+            raise ValueError(f'Cannot insert {key!r} into {type(container)}')
+    return container
+
+
+def insert(value, path: Union[str, list[str], tuple], container: Optional[Union[dict, list]]=None):
     """Insert ``value`` at ``path`` into ``container``.
 
     ``container`` is changed **in-place**!
@@ -62,42 +187,41 @@ def insert(value, path: Union[str, list[str]], container: Optional[Union[dict, l
         The value to insert.
     path
         The path where to insert ``value``. If a ``str``, it must be
-        dot-separated. Numeric strings are interpreted as list-index.
+        dot-separated. Numeric strings are interpreted as list-index. May
+        also be the parts of a path, e.g. as returned by :func:`parse_path`.
     container
         The container to insert into. If missing or ``None``, a new
         container object is created according to the first part of ``path``:
         If it's a numeric string a `list` is used, otherwise a ``dict``.
+        Indices beyond the end of a list append to the list.
 
     Returns
     -------
     container_or_value
-        The updated ``container`` or ``value`` if ``path`` is empty (i.e. at
-        the end of recursion).
+        The updated ``container`` or ``value`` if ``path`` is empty.
     """
+    if isinstance(path, str):
+        path = parse_path(path) if path else ()
+    elif not isinstance(path, tuple):
+        path = tuple(int(p) if isinstance(p, str) and p.isdigit() else p for p in path)
     if not path:
         return value
 
-    if isinstance(path, str):
-        path = path.split('.')
+    root = node = _container_for(container, path[0])
+    for i, key in enumerate(path):
+        if i == len(path) - 1:
+            child = value
+        elif isinstance(key, int):
+            child = _container_for(node[key] if key < len(node) else None, path[i + 1])
+        else:
+            child = _container_for(node.get(key), path[i + 1])
 
-    head, *tail = path
-    if head.isdigit():
-        if container is None:
-            container = []
-        if not isinstance(container, list):
-            raise ValueError(f'Cannot insert {head!r} into {type(container)}')
-        i = int(head)
-        if i < len(container):
-            container[i] = insert(value, tail, container[i])
+        if isinstance(key, int) and key >= len(node):
+            node.append(child)
         else:
-            container.append(insert(value, tail))
-    else:
-        if container is None:
-            container = {}
-        if not isinstance(container, dict):
-            raise ValueError(f'Cannot insert {head!r} into {type(container)}')
-        container[head] = insert(value, tail, container.get(head))
-    return container
+            node[key] = child
+        node = child
+    return root
 
 
 class AsSomethingMixin:
@@ -107,9 +231,12 @@ class AsSomethingMixin:
     data structure that can be serialized as JSON or YAML, i.e. just
     ``list``, ``dict``, and "scalars" (i.e. ``int``, ``str``, ``float``).
     """
-    def as_json(self, buf=None, indent=2, **dump_kw):
+    def as_json(self, buf=None, indent=2, stream=False, **dump_kw):
         """Serialize as JSON.
 
+        The data is encoded with :func:`json_dumps`, i.e. with ``orjson``
+        if it is installed.
+
         Parameters
         ----------
         buf
@@ -117,6 +244,9 @@ class AsSomethingMixin:
             to.
         indent
             The indentation level, passed to :func:`json.dump`.
+        stream
+            If ``True``, write to ``buf`` piece by piece (e.g. component by
+            component of a dashboard) instead of encoding all data at once.
         **dump_kw
             Other keyword arguments are passed through to :func:`json.dump`.
 
@@ -126,11 +256,22 @@ class AsSomethingMixin:
             If ``buf`` is specified, ``buf`` is returned, otherwise the
             JSON-serialized data.
         """
-        data = self.serialize()
+        if stream:
+            if not buf:
+                raise ValueError('Streaming JSON requires buf')
+            for chunk in self._iter_json(indent, **dump_kw):
+                buf.write(chunk)
+            return buf
+
+        data = json_dumps(self.serialize(), indent=indent, **dump_kw)
         if buf:
-            json.dump(data, buf, indent=indent, **dump_kw)
+            buf.write(data)
             return buf
-        return json.dumps(data, indent=indent, **dump_kw)
+        return data
+
+    def _iter_json(self, indent=2, **dump_kw):
+        """Yield the JSON-serialized data in pieces, see :meth:`as_json`."""
+        yield json_dumps(self.serialize(), indent=indent, **dump_kw)
 
     def as_yaml(self, buf=None, **dump_kw):
         """Serialize as YAML.
@@ -151,16 +292,21 @@ class AsSomethingMixin:
             If ``buf`` is specified, ``buf`` is returned, otherwise the
             YAML-serialized data.
         """
+        import yaml
+
         data = self.serialize()
         if buf:
-            yaml.dump(data, Dumper=NoAliasDumper, stream=buf, **dump_kw)
+            yaml.dump(data, Dumper=_no_alias_dumper(), stream=buf, **dump_kw)
             return buf
-        return yaml.dump(data, Dumper=NoAliasDumper, **dump_kw)
+        return yaml.dump(data, Dumper=_no_alias_dumper(), **dump_kw)
 
 
 class MergeWithBase(type):
     """Helper to merge ``_kw_paths`` and ``_default`` of all parent classes
     into ``kw_paths`` and ``default``, respectively.
+
+    The paths in ``kw_paths`` are parsed once into ``kw_plan``, mapping each
+    keyword argument to the parts of its path (see :func:`parse_path`).
     """
     def __init__(cls, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -169,8 +315,7 @@ class MergeWithBase(type):
         cls.kw_paths = {}
         for c in reversed(cls.mro()):
             cls.kw_paths.update(getattr(c, '_kw_paths', {}))
+        cls.kw_plan = {name: parse_path(path) for name, path in cls.kw_paths.items()}
 
         # Merge the default config
-        cls.default = {}
-        for c in reversed(cls.mro()):
-            cls.default = merge(cls.default, getattr(c, '_default', {}))
+        cls.default = merge({}, *(getattr(c, '_default', {}) for c in reversed(cls.mro())))
@@ -9,13 +9,17 @@ setup(
     author_email='pytrevl@trendence.com',
     license='MIT License',
     packages=['pytrevl'],
-    install_requires=['numpy>=1.23.5'
+    install_requires=['numpy>=1.23.5',
                       'pandas>=1.5',          
+                      'pyjwt>=2.0',
                       'pyyaml>=6.0',
                       'requests>=2.0.0',
-                      'sqlalchemy>=1.0'
-                      'cube_js_client'
+                      'sqlalchemy>=1.0',
                       ],
+    extras_require={
+        'arrow': ['pyarrow>=8'],
+        'fast': ['orjson>=3'],
+    },
 
     classifiers=[
         'Development Status :: 1 - Planning',
@@ -0,0 +1,55 @@
+from copy import deepcopy
+from http.server import ThreadingHTTPServer
+import threading
+
+import pytest
+
+
+class CubeStandIn:
+    """Cube.js client answering every query with ``rows``.
+
+    ``rows`` is a list of records or a function of the query returning
+    them. The queries are recorded in :attr:`queries`.
+    """
+    def __init__(self, rows, cache_key=None):
+        self.rows = rows
+        self.queries = []
+        if cache_key is not None:
+            self.cache_key = cache_key
+
+    def load(self, query):
+        self.queries.append(query)
+        return self.rows(query) if callable(self.rows) else deepcopy(self.rows)
+
+
+@pytest.fixture
+def cube_client():
+    """Create a :class:`CubeStandIn` with ``cube_client(rows)``."""
+    return CubeStandIn
+
+
+@pytest.fixture
+def http_server():
+    """Start a local HTTP server with ``http_server(handler, **attributes)``.
+
+    The attributes are set on the server, which is shut down after the test.
+    Its base URL is :attr:`url`.
+    """
+    servers = []
+
+    def start(handler, **attributes):
+        srv = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        for name, value in attributes.items():
+            setattr(srv, name, value)
+        # Ignore clients closing connections early, e.g. after a deadline
+        srv.handle_error = lambda request, client_address: None
+        host, port = srv.server_address
+        srv.url = f'http://{host}:{port}'
+        threading.Thread(target=srv.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(srv)
+        return srv
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
@@ -0,0 +1,407 @@
+import asyncio
+import gzip
+from http.server import BaseHTTPRequestHandler
+import json
+import threading
+import time
+
+import jwt
+import pytest
+
+from pytrevl.api import AsyncXMiddleService, CubeClient, CubeError, RenderError, XMiddleService, clients, xmiddle
+from pytrevl.hedging import DeadlineExceeded, HedgePolicy, LatencyHistogram
+from pytrevl.instrument import Aggregator
+from pytrevl.charts import BaseChart, Dashboard
+from pytrevl import CubeQuery
+
+# Long enough for HS256
+CUBE_SECRET = 'secret' * 6
+
+
+class XMiddleStandIn(BaseHTTPRequestHandler):
+    """Echo the components of a rendered dashboard after a short delay."""
+    delay = 0.05
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server.encodings.append(self.headers.get('Content-Encoding'))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        body = json.loads(body)
+        state = body.get('state') or {}
+        delay = state.get('delay', self.delay)
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            if 'slow_once' in state and state['slow_once'] not in server.seen:
+                server.seen.add(state['slow_once'])
+                delay = 1.0
+        time.sleep(delay)
+        with server.lock:
+            server.in_flight -= 1
+            server.requests += 1
+
+        config = body['abstractConfig']
+        if config.get('description') == 'fail' or any(c['id'] == 'fail' for c in config['components']):
+            data = json.dumps({'error': 'failed'}).encode()
+            self.send_response(500)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        components = body['abstractConfig']['components']
+        data = json.dumps({
+            'components': [{'id': c['id'], 'type': c['type']} for c in components],
+            'events': [],
+            'parameters': {},
+            'state': body.get('state'),
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(http_server):
+    return http_server(
+        XMiddleStandIn,
+        lock=threading.Lock(),
+        in_flight=0,
+        max_in_flight=0,
+        requests=0,
+        encodings=[],
+        seen=set(),
+    )
+
+
+class CubeHandler(BaseHTTPRequestHandler):
+    """Answer Cube.js loads, asking to wait once first."""
+    def do_POST(self):
+        server = self.server
+        server.tokens.append(self.headers['Authorization'])
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server.requests += 1
+        if server.requests == 1:
+            status, data = 200, {'error': 'Continue wait'}
+        elif 'unavailable' in body['query']:
+            status, data = 503, {'error': 'unavailable'}
+        elif 'fail' in body['query']:
+            status, data = 400, {'error': 'Invalid query'}
+        else:
+            status, data = 200, {'data': [{'cube.m': '1'}], 'query': body['query']}
+        data = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def cube_server(http_server):
+    return http_server(CubeHandler, requests=0, tokens=[])
+
+
+@pytest.fixture
+def base_url(server):
+    return server.url
+
+
+@pytest.fixture
+def chart():
+    query = CubeQuery('cube', ['measure'])
+    return BaseChart(query, 'id-chart')
+
+
+def test_render_async(base_url, chart):
+    async def main():
+        async with AsyncXMiddleService(base_url) as api:
+            resp = await Dashboard(components=[chart]).render_async(api, state={'a': 1})
+            comp = await chart.render_async(api)
+        return resp, comp
+
+    resp, comp = asyncio.run(main())
+    assert resp['components'] == [{'id': 'id-chart', 'type': 'chart'}]
+    assert resp['state'] == {'a': 1}
+    assert comp == {'id': 'id-chart', 'type': 'chart'}
+
+
+def test_render_async_concurrency_limit(server, base_url, chart):
+    async def main():
+        async with AsyncXMiddleService(base_url, max_concurrency=3) as api:
+            return await asyncio.gather(*(
+                Dashboard(components=[chart]).render_async(api) for _ in range(9)
+            ))
+
+    results = asyncio.run(main())
+    assert len(results) == 9
+    assert server.requests == 9
+    assert 1 < server.max_in_flight <= 3
+
+
+def test_from_env(monkeypatch, base_url):
+    monkeypatch.setenv('X_MIDDLE_BASEURL', base_url)
+    monkeypatch.setenv('X_MIDDLE_PASSWORD', 'secret')
+    api = AsyncXMiddleService.from_env(max_concurrency=2)
+    assert api.api_root == f'{base_url}/dashboards'
+    assert api.max_concurrency == 2
+    api.close()
+
+
+def test_render_many(server, base_url, chart):
+    api = XMiddleService(base_url, retries=0)
+    dashboards = [Dashboard(components=[chart]) for _ in range(6)]
+    dashboards[2] = Dashboard('fail', [chart])
+
+    batch = api.render_many(dashboards, max_workers=3)
+    assert len(batch) == 6
+    assert [r.index for r in batch] == list(range(6))
+    assert [r.dashboard for r in batch] == dashboards
+    assert [r.index for r in batch.errors] == [2]
+    assert isinstance(batch.errors[0].error, RenderError)
+    assert batch.responses[0]['components'] == [{'id': 'id-chart', 'type': 'chart'}]
+    assert batch.responses[2] is None
+    assert 1 < server.max_in_flight <= 3
+    assert batch.request_time > batch.wall_time
+    assert batch.speedup > 1
+
+
+def test_render_many_connection_error(chart):
+    import requests
+
+    # Nothing listens on port 1
+    api = XMiddleService('http://127.0.0.1:1', retries=0)
+    batch = api.render_many([Dashboard(components=[chart])] * 2)
+    assert len(batch.errors) == 2
+    assert all(isinstance(r.error, requests.ConnectionError) for r in batch)
+
+
+def test_render_many_unordered(base_url, chart):
+    api = XMiddleService(base_url)
+    batch = api.render_many([Dashboard(components=[chart])] * 4, max_workers=2, ordered=False, state={'a': 1})
+    assert sorted(r.index for r in batch) == [0, 1, 2, 3]
+    assert all(r.response['state'] == {'a': 1} for r in batch)
+
+
+def test_render_split(server, base_url):
+    query = CubeQuery('cube', ['measure'])
+    charts = [BaseChart(query, f'id-{i}') for i in range(3)]
+    dashboard = Dashboard(components=charts)
+    api = XMiddleService(base_url)
+
+    resp = dashboard.render(api, split=True)
+    assert [c['id'] for c in resp['components']] == ['id-0', 'id-1', 'id-2']
+    assert resp['events'] == []
+    assert server.requests == 3
+
+    # Everything is cached
+    assert dashboard.render(api, split=True) == resp
+    assert server.requests == 3
+
+    # Only the changed chart is rendered again
+    charts[1]['title.text'] = 'changed'
+    assert dashboard.render(api, split=True) == resp
+    assert server.requests == 4
+
+    # A different state is not cached yet
+    resp = dashboard.render(api, split=True, state={'a': 1})
+    assert resp['state'] == {'a': 1}
+    assert server.requests == 7
+    assert api.component_cache.stats.hits == 5
+
+    # The description is part of the request
+    dashboard.description = 'other'
+    dashboard.render(api, split=True)
+    assert server.requests == 10
+
+    # Bypassing the cache renders everything again
+    dashboard.render(api, split=True, use_cache=False)
+    assert server.requests == 13
+
+
+def test_render_split_ttl(server, base_url, chart):
+    api = XMiddleService(base_url, component_ttl=0.1)
+    dashboard = Dashboard(components=[chart])
+    dashboard.render(api, split=True)
+    dashboard.render(api, split=True)
+    assert server.requests == 1
+    time.sleep(0.2)
+    dashboard.render(api, split=True)
+    assert server.requests == 2
+
+
+def test_retries(server, base_url, chart):
+    api = XMiddleService(base_url, retries=2, backoff_factor=0)
+    # Renders are hedged instead of retried after being sent
+    with pytest.raises(RenderError):
+        api(Dashboard('fail', [chart]))
+    assert server.requests == 1
+    # Only failed connections are retried for all methods
+    retry = api._session.get_adapter(api.api_root).max_retries
+    assert retry.allowed_methods == {'GET'}
+    assert retry.connect is None
+
+
+def test_cube_client(cube_server):
+    client = CubeClient(cube_server.url, CUBE_SECRET, pool_size=4, retries=2, backoff_factor=0)
+    adapter = client._session.get_adapter(client.load_url)
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 2
+
+    # Polled after "Continue wait"
+    assert client.load({'measures': ['cube.m']}) == [{'cube.m': '1'}]
+    assert cube_server.requests == 2
+    with pytest.raises(CubeError, match='Invalid query'):
+        client.load({'fail': True})
+    # Queries are not retried after being sent
+    with pytest.raises(CubeError, match='unavailable'):
+        client.load({'unavailable': True})
+    assert cube_server.requests == 4
+
+    claims = jwt.decode(cube_server.tokens[0], CUBE_SECRET, algorithms=['HS256'])
+    assert claims['exp'] - claims['iat'] == client.token_ttl
+    assert CubeClient('http://cube/cubejs-api/v1/', 'secret').load_url == 'http://cube/cubejs-api/v1/load'
+    client.close()
+
+
+def test_compression(server, base_url):
+    query = CubeQuery('cube', ['measure'])
+    small = Dashboard(components=[BaseChart(query, 'id-small')])
+    large = Dashboard(components=[BaseChart(query, f'id-{i}') for i in range(20)])
+
+    api = XMiddleService(base_url, compress_min_size=1024, pool_size=2, timeout=5)
+    assert len(api(large)['components']) == 20
+    api(small)
+    assert server.encodings == ['gzip', None]
+
+    XMiddleService(base_url, compress_min_size=None)(large)
+    assert server.encodings[-1] is None
+
+
+def test_deadline(base_url, chart):
+    api = XMiddleService(base_url, retries=0)
+    dashboard = Dashboard(components=[chart])
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        dashboard.render(api, state={'delay': 0.5}, deadline=0.1)
+    assert time.monotonic() - start < 0.4
+    assert dashboard.render(api, deadline=1)['components']
+    with pytest.raises(DeadlineExceeded):
+        dashboard.render(api, split=True, state={'delay': 0.5}, deadline=0.1)
+
+    batch = api.render_many([dashboard, dashboard], state={'delay': 0.5}, deadline=0.1)
+    assert all(isinstance(r.error, DeadlineExceeded) for r in batch)
+
+    async def main():
+        async with AsyncXMiddleService(base_url) as api:
+            await dashboard.render_async(api, state={'delay': 0.5}, deadline=0.1)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+
+
+def test_hedging(server, base_url, chart):
+    api = XMiddleService(base_url, hedge=HedgePolicy(percentile=0.9, min_samples=3))
+    dashboard = Dashboard(components=[chart])
+    for _ in range(3):
+        dashboard.render(api)
+    assert api.latency.count == 3
+
+    start = time.monotonic()
+    resp = dashboard.render(api, state={'slow_once': 'a'})
+    assert resp['state'] == {'slow_once': 'a'}
+    assert time.monotonic() - start < 0.5
+    # The slow request is still running
+    assert server.in_flight == 1
+    assert server.requests == 4
+
+    api.close()
+    with pytest.raises(RuntimeError, match='after shutdown'):
+        dashboard.render(api, deadline=1)
+
+
+def test_latency_histogram():
+    latency = LatencyHistogram()
+    assert latency.percentile(0.5) is None
+    for ms in range(1, 101):
+        latency.record(ms / 1000)
+    assert latency.count == 100
+    assert latency.percentile(0.5) == pytest.approx(0.05, rel=0.1)
+    assert latency.percentile(0.99) == pytest.approx(0.099, rel=0.1)
+
+
+def test_instrumentation(base_url, chart):
+    api = XMiddleService(base_url)
+    with Aggregator() as stats:
+        Dashboard(components=[chart]).render(api)
+        asyncio.run(AsyncXMiddleService(base_url)(Dashboard(components=[chart])))
+
+    render = stats.stages['xmiddle.render']
+    assert render.count == 2
+    assert render.attributes['request_bytes'] > 0
+    assert render.attributes['response_bytes'] > 0
+    assert render.values == {'status': {200: 2}}
+    for stage in ('dashboard.serialize', 'xmiddle.encode', 'xmiddle.request', 'xmiddle.decode'):
+        assert stats.stages[stage].count == 2
+    assert render.total >= stats.stages['xmiddle.request'].total
+
+
+def test_named_clients(base_url, chart):
+    clients.register('xmiddle', 'test', base_url=base_url, retries=0)
+    try:
+        resp = Dashboard(components=[chart]).render('test', state={'a': 1})
+        assert resp['state'] == {'a': 1}
+        assert xmiddle(name='test') is clients.get('xmiddle', 'test')
+        # Unknown names do not fall back to the default configuration
+        with pytest.raises(KeyError, match='tset'):
+            Dashboard(components=[chart]).render('tset')
+        assert ('xmiddle', 'tset') not in clients
+    finally:
+        clients.reset()
+
+
+@pytest.mark.filterwarnings('ignore:Consider using IPython.display.IFrame')
+def test_show_progressive(monkeypatch, server, base_url):
+    display = pytest.importorskip('IPython.display')
+
+    class Handle:
+        def __init__(self, obj):
+            self.updates = [obj.data]
+
+        def update(self, obj):
+            self.updates.append(obj.data)
+
+    handles = []
+    def fake_display(obj, display_id=False):
+        handles.append(Handle(obj))
+        return handles[-1]
+    monkeypatch.setattr(display, 'display', fake_display)
+
+    query = CubeQuery('cube', ['measure'])
+    charts = [BaseChart(query, id) for id in ('id-0', 'fail', 'id-2')]
+    dashboard = Dashboard(components=charts)
+    assert dashboard.show(XMiddleService(base_url, retries=0), progressive=True, state={'delay': 0.1}) is None
+
+    assert [len(h.updates) for h in handles] == [2, 2, 2]
+    assert all('Rendering ' in h.updates[0] for h in handles)
+    assert '<iframe' in handles[0].updates[1]
+    assert 'failed' in handles[1].updates[1]
+    assert server.requests == 3
+    assert 1 < server.max_in_flight
+
+    # Components show transport errors, too
+    handles.clear()
+    assert dashboard.show(XMiddleService('http://127.0.0.1:1', retries=0), progressive=True) is None
+    assert [len(h.updates) for h in handles] == [2, 2, 2]
+    assert all('Connection' in h.updates[1] for h in handles)
@@ -1,10 +1,11 @@
 from io import StringIO
 import json
+import pickle
 
 import pytest
 import yaml
 
-from pytrevl.charts import BaseChart, Dashboard
+from pytrevl.charts import BaseChart, CustomChart, Dashboard
 from pytrevl import CubeQuery
 
 @pytest.fixture
@@ -134,3 +135,91 @@ def test_custom_settings(query):
     assert 'baz' == test['display']['foo']['bar']
 
 
+
+
+def test_extract_chart_dataframe():
+    from pytrevl.charts import extract_chart_dataframe, extract_dataframe
+
+    rendered = {
+        'xAxis': {'categories': ['a', 'b']},
+        'yAxis': {'categories': ['low', 'high']},
+        'series': [
+            {'name': 's1', 'data': [{'x': 0, 'y': 1, 'value': 3}, {'x': 1, 'y': 0, 'value': 4}]},
+            {'name': 's2', 'stack': 'st', 'data': [{'x': 1, 'y': 1, 'value': 5}]},
+        ],
+    }
+    df = extract_chart_dataframe(rendered)
+    assert df['x'].tolist() == ['a', 'b', 'b']
+    assert df['y'].tolist() == ['high', 'low', 'high']
+    assert df['value'].tolist() == [3, 4, 5]
+    assert df['series_name'].dtype == 'category'
+    assert df['series_name'].tolist() == ['s1', 's1', 's2']
+    assert df['stack'].isna().tolist() == [True, True, False]
+    assert df.index.tolist() == [0, 1, 2]
+
+    single = extract_dataframe(rendered['series'][1], rendered)
+    assert single.to_dict('records') == [{'x': 'b', 'y': 'high', 'value': 5, 'series_name': 's2', 'stack': 'st'}]
+
+
+def test_extract_chart_dataframe_point_arrays():
+    from pytrevl.charts import extract_chart_dataframe
+
+    df = extract_chart_dataframe({'series': [{'data': [[1, 2], [3, 4]]}, {'data': [5]}]})
+    assert df['x'].tolist()[:2] == [1, 3]
+    assert df['y'].tolist() == [2, 4, 5]
+
+
+def test_unknown_kwarg(query):
+    with pytest.raises(ValueError, match='unknown keyword argument .unknown.'):
+        BaseChart(query, unknown=1)
+
+    c = BaseChart(query)
+    c.kwargs['other'] = 1
+    with pytest.raises(ValueError, match='unknown keyword argument .other.'):
+        c.serialize()
+
+
+def test_serialization_cache(query, simple_chart):
+    serialized = simple_chart.serialize()
+    content_hash = simple_chart.content_hash
+    assert simple_chart.serialize() is serialized
+    assert simple_chart.content_hash == content_hash
+
+    def changes(func):
+        before = simple_chart.serialize()
+        func()
+        after = simple_chart.serialize()
+        assert after is not before
+        assert simple_chart.content_hash != content_hash
+        return after
+
+    assert changes(lambda: simple_chart.__setitem__('foo', 1))['display']['foo'] == 1
+    assert changes(lambda: simple_chart.kwargs.update(title='new'))['display']['title']['text'] == 'new'
+    assert changes(lambda: simple_chart.kwargs.pop('title'))['display'].get('title') is None
+    assert changes(lambda: query.measures.append('other'))['queries'][0]['measures'] == ['cube.measure', 'cube.other']
+    assert changes(lambda: setattr(simple_chart, 'id', 'new-id'))['id'] == 'new-id'
+
+    dashboard = Dashboard(components=[simple_chart])
+    assert dashboard.serialize()['components'][0] is simple_chart.serialize()
+    dashboard_hash = dashboard.content_hash
+    dashboard.components.append(BaseChart(query, 'other'))
+    assert dashboard.content_hash != dashboard_hash
+
+
+def test_custom_chart_changes():
+    chart = CustomChart({'id': 'custom', 'type': 'chart', 'display': {'title': {'text': 'a'}}, 'queries': []})
+    content_hash = chart.content_hash
+    chart.trevl_code['display']['title']['text'] = 'b'
+    assert chart.serialize()['display']['title']['text'] == 'b'
+    assert chart.content_hash != content_hash
+
+
+def test_pickle(simple_chart):
+    simple_chart.serialize()
+    loaded = pickle.loads(pickle.dumps(simple_chart))
+    assert loaded.serialize() == simple_chart.serialize()
+
+    # The copy tracks its own kwargs
+    loaded.kwargs['title'] = 'new'
+    assert loaded.serialize()['display']['title']['text'] == 'new'
+    assert simple_chart.serialize()['display']['title']['text'] != 'new'
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+from pytrevl import cache as cache_module
+from pytrevl.cache import ArrowDiskCache, LRUCache, query_cache
+
+
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    # 'b' was the least recently used item
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.evictions) == (2, 1, 1)
+
+
+def test_lru_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('pytrevl.cache.monotonic', lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.put('a', 1)
+    now[0] = 105.0
+    assert cache.get('a') == 1
+    now[0] = 111.0
+    assert cache.get('a') is None
+    assert 'a' not in cache
+    assert cache.stats.evictions == 1
+
+
+def test_disk_cache_failed_put(tmp_path):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    cache = ArrowDiskCache(str(tmp_path))
+    os.mkdir(cache._path('a'))
+    with pytest.raises(OSError):
+        cache.put('a', pd.DataFrame({'x': [1, 2]}))
+    # The temporary file is removed
+    assert os.listdir(tmp_path) == ['a.arrow']
+
+
+def test_query_cache_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setenv('PYTREVL_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(cache_module, '_query_cache', None)
+    # Importing a module mapped to None raises ImportError
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with pytest.warns(UserWarning, match=r'pytrevl\[arrow\]'):
+        cache = query_cache()
+    assert cache.disk is None
+    assert query_cache() is cache
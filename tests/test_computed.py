@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from pytrevl.computed import ComputedError, evaluate
+from pytrevl.cube import Computed, CubeQuery, MultiCubeQuery
+
+
+@pytest.fixture
+def columns():
+    return {
+        'a': pd.Series([1, 2, 3]),
+        'b': pd.Series([4.0, 5.0, 6.0]),
+    }
+
+
+@pytest.mark.parametrize('code, expected', [
+    ('a + b * 2', [9.0, 12.0, 15.0]),
+    ('-a ** 2 + a % 2', [0, -4, -8]),
+    ('a / sum(a)', [1 / 6, 2 / 6, 3 / 6]),
+    ('a > 1', [False, True, True]),
+    ('1 < a <= 2', [False, True, False]),
+    ('a > 1 and not b > 5', [False, True, False]),
+    # Boolean operators work on truth values, not bits
+    ('not a - 1', [True, False, False]),
+    ('a - 1 and b', [False, True, True]),
+    ('a - 2 or 0', [True, False, True]),
+    ('1 and 2', True),
+    ('0 or None', False),
+    ('a if a >= 2 else 0', [0, 2, 3]),
+    ('round(b / 3, 1)', [1.3, 1.7, 2.0]),
+    ('max(b) - min(b) + count(a)', 5.0),
+])
+def test_evaluate(columns, code, expected):
+    result = evaluate(code, columns)
+    if isinstance(result, pd.Series):
+        result = result.tolist()
+    assert result == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('code, message', [
+    ('c + 1', "unknown name 'c'"),
+    ('a.b', 'unsupported expression Attribute'),
+    ('a.sum()', 'unsupported function'),
+    ('exp(a)', 'unsupported function'),
+    ('[a, b]', 'unsupported expression List'),
+    ('a & b', 'unsupported operator BitAnd'),
+    ('a +', 'invalid syntax'),
+])
+def test_unsupported(columns, code, message):
+    with pytest.raises(ComputedError, match=message):
+        evaluate(code, columns)
+
+
+def test_get_data_include_computed(cube_client):
+    client = cube_client([
+        {'cube.d': 'x', 'cube.m': '1', 'cube.n': '4'},
+        {'cube.d': 'y', 'cube.m': '3', 'cube.n': '4'},
+    ])
+
+    query = CubeQuery('cube', ['m', 'n'], ['d'], computed=[
+        Computed('ratio', 'a / b', {'a': 'm', 'b': 'n'}),
+        Computed('share', 'ratio / sum(ratio) * 100'),
+    ])
+    df = query.get_data(client, cache=False, include_computed=True)
+    assert df['ratio'].tolist() == [0.25, 0.75]
+    assert df['share'].tolist() == [25.0, 75.0]
+    assert 'ratio' not in query.get_data(client, cache=False)
+
+    query = MultiCubeQuery(['cube.m'], ['cube.d'], computed=[Computed('double', 'x * 2', {'x': 'cube.m'})])
+    df = query.get_data(client, cache=False, include_computed=True)
+    assert df['double'].tolist() == [2, 6]
@@ -1,6 +1,6 @@
 import pytest
 
-from pytrevl.cube import Computed, CubeQuery, MultiCubeQuery
+from pytrevl.cube import Computed, CubeQuery, MultiCubeQuery, _paging_order, records_to_frame, records_to_table
 
 @pytest.fixture
 def query():
@@ -52,3 +52,161 @@ def test_multicube_query():
 
     assert query['cubeA.meas1'] == '$cubeA.meas1'
     assert query['cubeA.meas1'] == '$cubeA.meas1'
+
+
+ROWS = [
+    {'cube-name.d-1': 'a', 'cube-name.m-1': '1'},
+    {'cube-name.d-1': 'b', 'cube-name.m-1': '2'},
+]
+
+
+def test_get_data_cache(tmp_path, cube_client):
+    pytest.importorskip('pyarrow')
+    from pytrevl.cache import QueryCache
+
+    query = CubeQuery('cube-name', ['m-1'], ['d-1'], computed=[Computed('c-1', 'code-1')])
+    client = cube_client(ROWS)
+    cache = QueryCache(directory=str(tmp_path))
+
+    df = query.get_data(client, cache)
+    assert client.queries == [query.serialize(include_computed=False)]
+    assert list(df['cube-name.d-1']) == ['a', 'b']
+
+    # Served from memory
+    assert query.get_data(client, cache).equals(df)
+    assert len(client.queries) == 1
+
+    # Served from disk, e.g. in another process
+    other = QueryCache(directory=str(tmp_path))
+    assert query.get_data(client, other).equals(df)
+    assert len(client.queries) == 1
+    assert other.stats['disk'].hits == 1
+
+    # Changed queries are loaded again
+    CubeQuery('cube-name', ['m-1', 'm-2'], ['d-1']).get_data(client, cache)
+    assert len(client.queries) == 2
+
+    query.get_data(client, cache=False)
+    assert len(client.queries) == 3
+    assert (cache.stats['memory'].hits, cache.stats['memory'].misses) == (1, 2)
+
+
+def test_get_data_cache_per_client(cube_client):
+    from pytrevl.api import CubeClient
+    from pytrevl.cache import QueryCache
+
+    query = CubeQuery('cube', ['m'])
+    cache = QueryCache()
+    assert query.get_data(cube_client([{'cube.m': '1'}]), cache)['cube.m'].tolist() == [1]
+    assert query.get_data(cube_client([{'cube.m': '2'}]), cache)['cube.m'].tolist() == [2]
+    # Clients of the same endpoint share results
+    assert query.get_data(cube_client([{'cube.m': '3'}], 'server'), cache)['cube.m'].tolist() == [3]
+    assert query.get_data(cube_client([{'cube.m': '4'}], 'server'), cache)['cube.m'].tolist() == [3]
+
+    keys = {CubeClient(url, secret).cache_key for url, secret in [('http://a', 's'), ('http://b', 's'), ('http://a', 't')]}
+    assert len(keys) == 3
+
+
+def test_merge_queries():
+    from pytrevl.cube import Filter, merge_queries
+
+    a = CubeQuery('cube', ['m-1'], ['d-1', 'd-2'])
+    b = CubeQuery('cube', ['m-2', 'm-1'], ['d-2', 'd-1'])
+    c = CubeQuery('cube', ['m-1'], ['d-1'], [Filter('d-2', 'equals', ['x'])])
+    d = MultiCubeQuery(['cubeA.meas1'], ['cubeA.dim1'])
+
+    merged, indices = merge_queries([a, b, c, d, d])
+    assert indices == [0, 0, 1, 2, 2]
+    assert merged[0].measures == ['m-1', 'm-2']
+    assert merged[0].dimensions == ['d-1', 'd-2']
+    assert merged[1] == c
+    assert merged[2] is d
+    # The inputs are not changed
+    assert a.measures == ['m-1']
+
+
+def test_dashboard_get_data(cube_client):
+    from pytrevl.charts import BaseChart, Dashboard
+
+    q1 = CubeQuery('cube', ['m-1'], ['d-1'])
+    q2 = CubeQuery('cube', ['m-2'], ['d-1'])
+    dashboard = Dashboard(components=[
+        BaseChart(q1, 'c-1'), BaseChart(q2, 'c-2'), BaseChart(q1, 'c-3'),
+    ])
+    client = cube_client([{'cube.d-1': 'a', 'cube.m-1': '1', 'cube.m-2': '2'}])
+    dfs = dashboard.get_data(client, cache=False)
+
+    assert client.queries == [{'measures': ['cube.m-1', 'cube.m-2'], 'dimensions': ['cube.d-1']}]
+    assert list(dfs) == ['c-1', 'c-2', 'c-3']
+    assert list(dfs['c-1'].columns) == ['cube.d-1', 'cube.m-1']
+    assert list(dfs['c-2'].columns) == ['cube.d-1', 'cube.m-2']
+    assert dfs['c-2']['cube.m-2'].tolist() == [2]
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_iter_data(prefetch, cube_client):
+    rows = [{'cube.m': str(i)} for i in range(25)]
+    client = cube_client(lambda query: rows[query['offset']:query['offset'] + query['limit']])
+    chunks = list(CubeQuery('cube', ['m']).iter_data(10, client, prefetch=prefetch))
+    assert [len(df) for df in chunks] == [10, 10, 5]
+    assert chunks[2]['cube.m'].tolist() == [20, 21, 22, 23, 24]
+    assert [(q['offset'], q['limit']) for q in client.queries] == [(0, 10), (10, 10), (20, 10)]
+    assert client.queries[0]['measures'] == ['cube.m']
+    assert 'order' not in client.queries[0]
+
+    # Pages are ordered by all dimensions
+    client.queries.clear()
+    list(CubeQuery('cube', ['m'], ['d-1', 'd-2']).iter_data(10, client, prefetch=prefetch))
+    assert client.queries[0]['order'] == [['cube.d-1', 'asc'], ['cube.d-2', 'asc']]
+    assert _paging_order({'dimensions': ['a', 'b'], 'order': {'b': 'desc'}}) == [['b', 'desc'], ['a', 'asc']]
+
+    # No empty chunk is yielded if the last page is full
+    client.queries.clear()
+    chunks = list(CubeQuery('cube', ['m']).iter_data(5, client, prefetch=prefetch))
+    assert [len(df) for df in chunks] == [5] * 5
+    assert len(client.queries) == 6
+
+
+def test_get_data_types(cube_client):
+    client = cube_client([
+        {'cube.day': '2023-01-0%dT00:00:00.000' % (i % 3 + 1), 'cube.kind': 'ab'[i % 2], 'cube.label': f'l{i}', 'cube.m': str(i / 2)}
+        for i in range(6)
+    ])
+    query = CubeQuery('cube', ['m'], ['day', 'kind', 'label'])
+    df = query.get_data(client, cache=False)
+    assert df['cube.m'].dtype == 'float64'
+    assert df['cube.m'].tolist() == [0, 0.5, 1, 1.5, 2, 2.5]
+    assert df['cube.day'].dtype == 'datetime64[ns]'
+    assert df['cube.kind'].dtype == 'category'
+    assert df['cube.label'].dtype == object
+
+    pa = pytest.importorskip('pyarrow')
+    table = query.get_data(client, cache=False, format='arrow')
+    assert table.schema.field('cube.m').type == pa.float64()
+    assert pa.types.is_timestamp(table.schema.field('cube.day').type)
+    assert pa.types.is_dictionary(table.schema.field('cube.kind').type)
+
+    with pytest.raises(ValueError):
+        query.get_data(client, cache=False, format='csv')
+
+
+def test_mixed_timestamps(monkeypatch, cube_client):
+    records = [{'cube.d': '2023-01-01T00:00:00.000'}, {'cube.d': 'unknown'}] * 3
+    df = records_to_frame(records)
+    assert df['cube.d'].dtype == 'category'
+    assert df['cube.d'].tolist() == ['2023-01-01T00:00:00.000', 'unknown'] * 3
+
+    pa = pytest.importorskip('pyarrow')
+    assert pa.types.is_dictionary(records_to_table(records).schema.field('cube.d').type)
+
+    table = records_to_table([{'cube.m': '1', 'cube.x': '0.5', 'cube.d': None}, {'cube.m': '2', 'cube.x': None, 'cube.d': 'a'}], ['cube.m', 'cube.x'])
+    assert table.schema.field('cube.m').type == pa.int64()
+    assert table.schema.field('cube.x').type == pa.float64()
+    assert table.column('cube.d').to_pylist() == [None, 'a']
+
+    # Tables are built without a data frame
+    def fail(*args, **kwargs):
+        raise AssertionError('built a data frame')
+    monkeypatch.setattr('pytrevl.cube.records_to_frame', fail)
+    query = CubeQuery('cube-name', ['m-1'], ['d-1'])
+    assert query.get_data(cube_client(ROWS), cache=False, format='arrow').num_rows == 2
@@ -0,0 +1,43 @@
+from io import StringIO
+import json
+
+import pytest
+
+from pytrevl.charts import BaseChart, Dashboard
+from pytrevl import CubeQuery
+
+
+@pytest.fixture
+def chart():
+    query = CubeQuery('cube', ['measure'])
+    return BaseChart(query, 'id-simple', x=query['measure'], y=query['measure'], title='chart title')
+
+
+@pytest.mark.parametrize('indent', [None, 2, 4])
+def test_json_streaming(chart, indent):
+    for dashboard in (Dashboard(), Dashboard('desc', [chart, chart])):
+        buf = StringIO()
+        assert dashboard.as_json(buf, indent=indent, stream=True) is buf
+        assert json.loads(buf.getvalue()) == dashboard.serialize()
+        if indent:
+            assert buf.getvalue() == dashboard.as_json(indent=indent)
+
+
+def test_yaml_round_trip(chart, tmp_path):
+    dashboard = Dashboard('desc', [chart])
+    loaded = Dashboard.from_yaml(dashboard.as_yaml())
+    assert loaded.serialize() == dashboard.serialize()
+
+    # No anchors and aliases for shared objects
+    chart.kwargs.update(x={'a': 1}, y=chart.kwargs['x'])
+    shared = Dashboard(components=[chart, chart])
+    assert '&' not in shared.as_yaml()
+
+    (tmp_path / 'a.yaml').write_text(dashboard.as_yaml() + '---\n' + shared.as_yaml())
+    (tmp_path / 'b.yaml').write_text(Dashboard('b').as_yaml())
+    dashboards = Dashboard.from_yaml_many([tmp_path / 'a.yaml', tmp_path / 'b.yaml', tmp_path / 'missing.yaml'])
+    assert next(dashboards).description == 'desc'
+    assert next(dashboards).serialize() == shared.serialize()
+    assert next(dashboards).description == 'b'
+    with pytest.raises(FileNotFoundError):
+        next(dashboards)
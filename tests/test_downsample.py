@@ -0,0 +1,113 @@
+import numpy as np
+
+from pytrevl import CubeQuery, Dashboard, LineChart
+from pytrevl.charts import extract_chart_dataframe
+from pytrevl.downsample import bin_heatmap, bin_points, downsample_chart, lttb
+
+
+def test_lttb():
+    x = np.arange(10000, dtype=float)
+    y = np.sin(x / 500)
+    y[5000] = 10  # A spike must survive
+    indices = lttb(x, y, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 9999
+    assert np.all(np.diff(indices) > 0)
+    assert 5000 in indices
+
+    assert len(lttb(x[:50], y[:50], 100)) == 50
+
+
+def test_bin_points():
+    rng = np.random.default_rng(0)
+    x, y = rng.random(10000), rng.random(10000)
+    x[0], y[0] = 100, 100  # An outlier must survive
+    indices = bin_points(x, y, 400)
+    assert len(indices) <= 400
+    assert 0 in indices
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_bin_heatmap():
+    x, y = np.meshgrid(np.arange(100), np.arange(100))
+    factor, bx, by, value = bin_heatmap(x.ravel(), y.ravel(), np.ones(10000), 100)
+    assert factor == 10
+    assert len(bx) == 100
+    assert bx.min() == 4.5
+    assert np.all(value == 1)
+
+
+def test_downsample_chart():
+    n = 5000
+    chart = {
+        'chart': {'type': 'line'},
+        'series': [
+            {'name': 'dicts', 'data': [{'x': i, 'y': i % 7} for i in range(n)]},
+            {'name': 'values', 'data': list(range(n)), 'pointStart': 100},
+            {'name': 'scatter', 'type': 'scatter', 'data': [[i % 101, i % 103] for i in range(n)]},
+            {'name': 'heatmap', 'type': 'heatmap', 'data': [{'x': i % 100, 'y': i // 100, 'value': 1} for i in range(n)]},
+            {'name': 'column', 'type': 'column', 'data': [{'x': i, 'y': i} for i in range(n)]},
+            {'name': 'options', 'data': [{'x': 0, 'y': 1, 'marker': {'enabled': True}}]},
+        ],
+    }
+    result, report = downsample_chart(chart, max_points=500)
+    dicts, values, scatter, heatmap, column, options = result['series']
+    assert len(dicts['data']) == 500 and dicts['data'][0] == [0, 0]
+    assert len(values['data']) == 500 and values['data'][0] == [100, 0]
+    assert 'pointStart' not in values
+    assert len(scatter['data']) <= 500
+    assert heatmap['keys'] == ['x', 'y', 'value'] and heatmap['colsize'] == 4
+    assert len(heatmap['data']) < 500
+    # Compactly encoded, but not downsampled
+    assert len(column['data']) == n and column['data'][1] == [1, 1]
+    assert options == chart['series'][5]
+
+    assert chart['series'][0]['data'][0] == {'x': 0, 'y': 0}
+    assert report.points_before == 5 * n + 1
+    assert report.points_removed == report.points_before - sum(len(s['data']) for s in result['series'])
+    assert 0 < report.bytes_after < report.bytes_before
+    assert 'Removed' in str(report)
+
+    df = extract_chart_dataframe(result)
+    assert set(df.columns) == {'x', 'y', 'value', 'marker', 'series_name'}
+    assert df[df.series_name == 'heatmap'].value.eq(1).all()
+
+
+def test_heatmap_point_arrays():
+    chart = {
+        'chart': {'type': 'heatmap'},
+        'series': [{'data': [[i % 100, i // 100, float(i)] for i in range(10000)]}],
+    }
+    result, _ = downsample_chart(chart, max_points=100)
+    heatmap = result['series'][0]
+    assert heatmap['keys'] == ['x', 'y', 'value'] and heatmap['colsize'] == 10
+    assert len(heatmap['data']) == 100
+
+    df = extract_chart_dataframe(chart)
+    assert set(df.columns) == {'x', 'y', 'value'}
+
+
+def test_categorical_heatmap():
+    chart = {
+        'chart': {'type': 'heatmap'},
+        'xAxis': {'categories': [str(i) for i in range(100)]},
+        'series': [{'data': [{'x': i % 100, 'y': i // 100, 'value': 1} for i in range(5000)]}],
+    }
+    result, _ = downsample_chart(chart, max_points=500)
+    assert len(result['series'][0]['data']) == 5000
+
+
+def test_line_chart_max_points(monkeypatch):
+    query = CubeQuery('cube', ['m'], ['d'])
+    chart = LineChart(query, id='line', max_points=100)
+    assert 'max_points' not in chart.kwargs
+    assert 'max_points' not in str(chart.serialize())
+
+    rendered = {'type': 'chart', 'id': 'line', 'series': [{'data': [[i, i] for i in range(1000)]}]}
+    monkeypatch.setattr(Dashboard, 'render', lambda self, *args, **kwargs: {'components': [rendered]})
+    assert len(chart.render()['series'][0]['data']) == 100
+    assert len(chart.get_data()) == 1000
+    assert len(Dashboard(components=[chart])._downsample([rendered], None)[0]['series'][0]['data']) == 100
+    chart.max_points = None
+    assert Dashboard(components=[chart])._downsample([rendered], None)[0] is rendered
+    assert len(Dashboard(components=[chart])._downsample([rendered], 10)[0]['series'][0]['data']) == 10
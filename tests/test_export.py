@@ -0,0 +1,107 @@
+import json
+import re
+
+import pytest
+import requests
+
+from pytrevl import CubeQuery, Dashboard, LineChart
+from pytrevl.api import RenderError, XMiddleService
+from pytrevl.export import export_html
+from pytrevl.notebook import HIGHCHARTS_SCRIPTS, asset_path
+
+
+class RenderStandIn(XMiddleService):
+    """Render each chart with the same categories and data, without a server."""
+    def __init__(self):
+        super().__init__('http://unused')
+        self.renders = 0
+
+    def _render(self, dashboard, event=None, state=None, deadline=None):
+        self.renders += 1
+        if dashboard.description == 'fail':
+            raise RenderError(ValueError('failed'))
+        if dashboard.description == 'down':
+            raise requests.ConnectionError('down')
+        return {'components': [
+            {
+                'type': 'unknown' if dashboard.description == 'unknown' else 'chart',
+                'id': c.id,
+                'xAxis': {'categories': ['a', 'b', 'c']},
+                'series': [{'name': c.id, 'data': [1, 2, 3]}],
+            }
+            for c in dashboard.components
+        ]}
+
+
+@pytest.fixture
+def asset_dir(tmp_path):
+    directory = tmp_path / 'assets'
+    directory.mkdir()
+    for url in HIGHCHARTS_SCRIPTS:
+        with open(asset_path(directory, url), 'w') as f:
+            f.write(f'/* {url} */ var s = "</script>";')
+    return str(directory)
+
+
+@pytest.fixture
+def dashboard():
+    query = CubeQuery('cube', ['m'], ['d'])
+    return Dashboard('Report <1>', [LineChart(query, id=f'chart-{i}') for i in range(3)])
+
+
+def _script_json(doc, id):
+    return json.loads(re.search(f'<script type="application/json" id="{id}">(.*?)</script>', doc).group(1))
+
+
+def test_to_html(tmp_path, asset_dir, dashboard):
+    client = RenderStandIn()
+    path = tmp_path / 'report.html'
+    doc = dashboard.to_html(str(path), asset_dir=asset_dir, api_client=client)
+    assert client.renders == 1
+    assert path.read_text(encoding='utf-8') == doc
+    assert '<title>Report &lt;1&gt;</title>' in doc
+
+    # The runtime is inlined and cannot end its script element early
+    assert 'src=' not in doc
+    assert all(f'/* {url} */' in doc for url in HIGHCHARTS_SCRIPTS)
+    assert '"</script>"' not in doc
+
+    # Repeated data is stored once
+    assert _script_json(doc, 'pytrevl-shared') == [[1, 2, 3], ['a', 'b', 'c']]
+    options = _script_json(doc, 'pytrevl-options')
+    assert [o['series'][0]['data'] for o in options] == [{'$shared': 0}] * 3
+
+    cdn = dashboard.to_html(inline_assets=False, api_client=client)
+    assert all(f'src="{url}"' in cdn for url in HIGHCHARTS_SCRIPTS)
+
+
+def test_missing_assets(tmp_path, monkeypatch, dashboard):
+    monkeypatch.delenv('PYTREVL_ASSET_DIR', raising=False)
+    with pytest.raises(ValueError):
+        dashboard.to_html(api_client=RenderStandIn())
+    with pytest.raises(FileNotFoundError):
+        dashboard.to_html(asset_dir=str(tmp_path), api_client=RenderStandIn())
+
+
+def test_export_html(tmp_path, asset_dir, dashboard):
+    dashboards = [dashboard, Dashboard('fail'), dashboard, Dashboard('down')]
+    paths = [tmp_path / f'{i}.html' for i in range(4)]
+    batch = export_html(dashboards, paths, RenderStandIn(), max_workers=2, asset_dir=asset_dir)
+    assert [r.ok for r in batch] == [True, False, True, False]
+    assert paths[0].read_text(encoding='utf-8') == paths[2].read_text(encoding='utf-8')
+    assert not paths[1].exists()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['0.html', '2.html', 'assets']
+
+    with pytest.raises(ValueError):
+        export_html(dashboards, paths[:1], RenderStandIn(), asset_dir=asset_dir)
+
+
+def test_export_errors(tmp_path, asset_dir, dashboard):
+    # Building or writing a file fails for single dashboards only
+    (tmp_path / 'dir.html').mkdir()
+    dashboards = [dashboard, Dashboard('unknown', dashboard.components), dashboard]
+    paths = [tmp_path / 'dir.html', tmp_path / 'unknown.html', tmp_path / 'ok.html']
+    batch = export_html(dashboards, paths, RenderStandIn(), asset_dir=asset_dir)
+    assert [type(r.error) for r in batch] == [IsADirectoryError, ValueError, type(None)]
+    # No temporary files are left behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['assets', 'dir.html', 'ok.html']
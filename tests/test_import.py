@@ -0,0 +1,28 @@
+import re
+import subprocess
+import sys
+
+# Budget for the cumulative time of ``import pytrevl`` in microseconds
+IMPORT_TIME_BUDGET = 200_000
+
+# Modules only imported by the code paths needing them
+DEFERRED_MODULES = ['asyncio', 'IPython', 'jwt', 'numpy', 'pandas', 'pyarrow', 'requests', 'yaml']
+
+
+def test_import_time():
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import pytrevl'],
+        capture_output=True, text=True, check=True,
+    )
+    match = re.search(r'^import time:\s+\d+ \|\s+(\d+) \| pytrevl$', proc.stderr, re.MULTILINE)
+    assert match, proc.stderr
+    assert int(match.group(1)) < IMPORT_TIME_BUDGET
+
+
+def test_deferred_imports():
+    code = (
+        'import sys, pytrevl; '
+        f'print(",".join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))'
+    )
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert proc.stdout.strip() == ''
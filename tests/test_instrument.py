@@ -0,0 +1,67 @@
+import pytest
+
+from pytrevl import CubeQuery, Dashboard, LineChart
+from pytrevl.cache import QueryCache
+from pytrevl.instrument import Aggregator, add_listener, current_span, enabled, remove_listener, span
+
+
+def test_disabled():
+    assert not enabled()
+    with span('stage', a=1) as s:
+        s.set(b=2)
+        assert current_span() is s
+    assert span('other') is s
+
+
+def test_spans():
+    spans = []
+    add_listener(spans.append)
+    try:
+        assert enabled()
+        with span('outer', a=1) as outer:
+            with span('inner'):
+                current_span().set(b=2)
+            outer.set(c=3)
+        with pytest.raises(ValueError):
+            with span('failing'):
+                raise ValueError
+    finally:
+        remove_listener(spans.append)
+    assert not enabled()
+
+    assert [s.name for s in spans] == ['inner', 'outer', 'failing']
+    inner, outer, failing = spans
+    assert inner.parent == 'outer' and outer.parent is None
+    assert inner.attributes == {'b': 2}
+    assert outer.attributes == {'a': 1, 'c': 3}
+    assert outer.duration >= inner.duration > 0
+    assert failing.error == 'ValueError'
+
+
+def test_aggregator(cube_client):
+    query = CubeQuery('cube', ['m'], ['d'])
+    dashboard = Dashboard(components=[LineChart(query, id=f'c-{i}') for i in range(3)])
+    cache = QueryCache()
+    client = cube_client([{'cube.d': str(i), 'cube.m': str(i)} for i in range(10)])
+    with Aggregator() as stats:
+        dashboard.serialize()
+        query.get_data(client, cache)
+        query.get_data(client, cache)
+        with span('response', status=200):
+            pass
+    dashboard.serialize()
+
+    assert stats.stages['dashboard.serialize'].count == 1
+    assert stats.stages['dashboard.serialize'].attributes == {'components': 3}
+    get_data = stats.stages['cube.get_data']
+    assert get_data.count == 2
+    assert get_data.attributes == {'rows': 20}
+    assert get_data.values == {'cached': {False: 1, True: 1}}
+    assert stats.stages['cube.load'].count == 1
+    assert stats.stages['cube.to_frame'].attributes == {'rows': 10}
+    assert stats.stages['response'].values == {'status': {200: 1}}
+
+    report = stats.report().splitlines()
+    assert report[0].split()[:2] == ['stage', 'count']
+    assert len(report) == 6
+    assert any(line.startswith('response') and 'status=200:1' in line for line in report)
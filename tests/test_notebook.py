@@ -0,0 +1,41 @@
+import html
+import json
+import re
+
+import pytest
+
+from pytrevl.notebook import HIGHCHARTS_SCRIPTS, RENDERERS, _shared_document, render_shared
+
+
+@pytest.fixture
+def components():
+    charts = [
+        {'type': 'chart', 'id': f'chart-{i}', 'title': {'text': f'</script> {i}'}, 'series': []}
+        for i in range(3)
+    ]
+    return charts + [{'type': 'score', 'id': 'score', 'value': 42, 'unit': '%'}]
+
+
+def test_render_shared(components):
+    doc = _shared_document(components, 800, 400, '<script src="highcharts.js"></script>')
+    assert doc.count('<script src="highcharts.js">') == 1
+    assert re.findall(r'data-chart="(\d+)"', doc) == ['0', '1', '2']
+    assert '42 %' in doc
+
+    options = re.search(r'<script type="application/json" id="pytrevl-options">(.*?)</script>', doc).group(1)
+    assert json.loads(options) == components[:3]
+
+    iframe = render_shared(components)
+    assert iframe.count('<iframe') == 1
+    src_doc = html.unescape(re.search(r'srcdoc="(.*)"', iframe).group(1))
+    assert all(src_doc.count(src) == 1 for src in HIGHCHARTS_SCRIPTS)
+
+
+def test_render_iframes(components):
+    assert RENDERERS['iframe'](components).count('<iframe') == 3
+
+
+def test_unknown_component(components):
+    for render in RENDERERS.values():
+        with pytest.raises(ValueError):
+            render([{'type': 'unknown'}])
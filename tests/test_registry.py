@@ -0,0 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import threading
+import time
+
+import pytest
+
+from pytrevl.registry import ClientRegistry
+
+
+class Client:
+    def __init__(self, url='default'):
+        # Widen the window for races
+        time.sleep(0.01)
+        self.url = url
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def created():
+    """The clients created by the registry."""
+    return []
+
+
+@pytest.fixture
+def registry(created):
+    def factory(**options):
+        created.append(Client(**options))
+        return created[-1]
+
+    return ClientRegistry({'api': factory, 'local': factory}, per_thread={'local'})
+
+
+def test_shared(registry, created):
+    registry.register('api')
+    with ThreadPoolExecutor(8) as pool:
+        clients = list(pool.map(lambda _: registry.get('api'), range(32)))
+    assert all(c is clients[0] for c in clients)
+    assert len(created) == 1
+
+
+def test_per_thread(registry):
+    registry.register('local')
+    barrier = threading.Barrier(4)
+
+    def get(_):
+        barrier.wait()
+        return registry.get('local'), registry.get('local')
+
+    with ThreadPoolExecutor(4) as pool:
+        pairs = list(pool.map(get, range(4)))
+    assert all(a is b for a, b in pairs)
+    assert len({id(a) for a, _ in pairs}) == 4
+
+    registry.close('local')
+    assert all(a.closed for a, _ in pairs)
+    assert registry.get('local') not in [a for a, _ in pairs]
+
+
+def test_per_thread_released(registry):
+    registry.register('local')
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(registry.get('local'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    gc.collect()
+    assert len(clients) == 4
+    assert all(c.closed for c in clients)
+
+    # Clients of running threads are closed on close()
+    client = registry.get('local')
+    registry.close('local')
+    assert client.closed
+
+
+def test_named(registry):
+    registry.register('api', 'staging', url='https://staging')
+    assert registry.setdefault('api', url='https://default').url == 'https://default'
+    assert registry.setdefault('api', url='https://other').url == 'https://default'
+    staging = registry.get('api', 'staging')
+    assert staging.url == 'https://staging'
+    assert ('api', 'staging') in registry
+    with pytest.raises(KeyError):
+        registry.get('api', 'production')
+    with pytest.raises(ValueError):
+        registry.register('unknown')
+
+    # Replacing a configuration closes its clients
+    registry.register('api', 'staging', url='https://new-staging')
+    assert staging.closed
+    assert registry.get('api', 'staging').url == 'https://new-staging'
+
+
+def test_close_and_reset(registry):
+    registry.register('api')
+    registry.register('api', 'other')
+    default, other = registry.get('api'), registry.get('api', 'other')
+
+    registry.close(name='other')
+    assert other.closed and not default.closed
+    assert registry.get('api', 'other') is not other
+
+    registry.reset()
+    assert default.closed
+    with pytest.raises(KeyError):
+        registry.get('api')
@@ -0,0 +1,123 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import time
+
+import pytest
+import requests
+
+from pytrevl.api import RenderError, XMiddleService
+from pytrevl.charts import BaseChart, Dashboard
+from pytrevl.standin import Recording, StandInServer
+from pytrevl import CubeQuery
+
+
+class Upstream(BaseHTTPRequestHandler):
+    """Answer every request with its method, path and authorization.
+
+    The first :attr:`pending` requests are answered with Cube.js' "Continue
+    wait" and the status is :attr:`status`.
+    """
+    def respond(self):
+        self.server.requests += 1
+        if self.server.pending:
+            self.server.pending -= 1
+            body = {'error': 'Continue wait'}
+        else:
+            body = {
+                'method': self.command,
+                'path': self.path,
+                'authorization': self.headers.get('Authorization'),
+                'data': [{'cube.measure': '1'}],
+            }
+        data = json.dumps(body).encode()
+        self.send_response(self.server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.respond()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream(http_server):
+    return http_server(Upstream, requests=0, pending=0, status=200)
+
+
+@pytest.fixture
+def dashboard():
+    return Dashboard(components=[BaseChart(CubeQuery('cube', ['measure']), 'id-chart')])
+
+
+def test_record_and_replay(tmp_path, upstream, dashboard):
+    path = str(tmp_path / 'recording.json')
+    with StandInServer(Recording(path), xmiddle_upstream=upstream.url) as server:
+        api = XMiddleService(server.url, auth_password='secret')
+        resp = api(dashboard)
+        assert resp['path'] == '/dashboards'
+        assert resp['authorization'].startswith('Basic ')
+        assert api(dashboard) == resp
+        assert api.status()['path'] == '/dashboards/status'
+    assert upstream.requests == 2
+    assert (server.stats.recorded, server.stats.replayed) == (2, 1)
+
+    # Replayed from the file, without upstream
+    with StandInServer(Recording(path)) as server:
+        api = XMiddleService(server.url, compress_min_size=0)
+        assert api(dashboard) == resp
+        with pytest.raises(RenderError):
+            api(dashboard, state={'a': 1})
+    assert server.stats.missing == 1
+    assert server.stats.paths == {'/dashboards': 2}
+
+
+def test_cube_load(upstream):
+    query = {'measures': ['cube.measure']}
+    with StandInServer(cube_upstream=upstream.url) as server:
+        url = f'{server.url}/cubejs-api/v1/load'
+        resp = requests.get(url, params={'query': json.dumps(query)}).json()
+        assert resp['method'] == 'GET'
+        assert resp['data'] == [{'cube.measure': '1'}]
+        # POST requests with the same query are distinct recordings
+        assert requests.post(url, json={'query': query}).json()['method'] == 'POST'
+        assert requests.get(url, params={'query': json.dumps(query)}).json() == resp
+        assert requests.get(f'{server.url}/unknown').status_code == 404
+    assert upstream.requests == 2
+
+
+def test_transient_responses(upstream):
+    url_params = {'query': json.dumps({'measures': ['cube.measure']})}
+    with StandInServer(cube_upstream=upstream.url) as server:
+        url = f'{server.url}/cubejs-api/v1/load'
+        upstream.pending = 1
+        assert requests.get(url, params=url_params).json() == {'error': 'Continue wait'}
+        upstream.status = 500
+        assert requests.get(url, params=url_params).status_code == 500
+        upstream.status = 200
+        assert requests.get(url, params=url_params).json()['data'] == [{'cube.measure': '1'}]
+        assert requests.get(url, params=url_params).json()['data'] == [{'cube.measure': '1'}]
+    assert upstream.requests == 3
+    assert (server.stats.forwarded, server.stats.recorded, server.stats.replayed) == (2, 1, 1)
+    assert len(server.recording) == 1
+
+
+def test_latency_and_errors(upstream, dashboard):
+    with StandInServer(xmiddle_upstream=upstream.url, latency=0.1) as server:
+        api = XMiddleService(server.url)
+        start = time.monotonic()
+        api(dashboard)
+        assert time.monotonic() - start >= 0.1
+
+        server.latency = 0
+        server.error_rate = 1
+        with pytest.raises(RenderError):
+            XMiddleService(server.url, retries=0)(dashboard)
+    assert server.stats.injected_errors == 1
@@ -0,0 +1,75 @@
+import pytest
+
+from pytrevl.utils import merge
+
+
+def test_merge():
+    a = {'a': {'x': 1, 'y': [1, {'k': 'a'}]}, 'b': 'a'}
+    b = {'a': {'y': [None, {'l': 'b'}, 3]}, 'c': ['b']}
+    c = {'a': {'x': 3}, 'b': 'c'}
+
+    expected = {
+        'a': {'x': 3, 'y': [1, {'k': 'a', 'l': 'b'}, 3]},
+        'b': 'c',
+        'c': ['b'],
+    }
+    assert merge(a, b, c) == expected
+    assert merge(merge(a, b), c) == expected
+    assert merge(a, merge(b, c)) == expected
+
+
+def test_merge_copies():
+    a = {'a': {'x': [1]}}
+    b = {'b': {'y': [2]}}
+    merged = merge(a, b)
+    merged['a']['x'].append(3)
+    merged['b']['y'].append(3)
+    assert a == {'a': {'x': [1]}}
+    assert b == {'b': {'y': [2]}}
+
+    single = merge(a)
+    assert single == a and single['a'] is not a['a']
+
+
+def test_merge_type_mismatch():
+    with pytest.raises(ValueError):
+        merge({'a': 1}, {'a': 1}, {'a': {}})
+    with pytest.raises(ValueError):
+        merge({}, [])
+
+
+def test_insert():
+    from pytrevl.utils import insert, parse_path
+
+    assert parse_path('series.0.data.x') == ('series', 0, 'data', 'x')
+    assert insert(1, 'a.0.b') == {'a': [{'b': 1}]}
+    assert insert(1, ['a', '0', 'b']) == {'a': [{'b': 1}]}
+    assert insert(1, '') == 1
+
+    container = {'a': [{'b': 1}], 'c': 2}
+    assert insert(2, 'a.0.c', container) is container
+    # Indices beyond the end of a list append to it
+    insert(3, 'a.5.b', container)
+    assert container == {'a': [{'b': 1, 'c': 2}, {'b': 3}], 'c': 2}
+
+    with pytest.raises(ValueError):
+        insert(1, 'c.d', container)
+    with pytest.raises(ValueError):
+        insert(1, '0', {})
+
+
+def test_json_dumps(monkeypatch):
+    import json
+    from dataclasses import dataclass
+    from pytrevl import utils
+
+    @dataclass
+    class Point:
+        x: int
+
+    data = {'a': [1, 'ü', Point(2)]}
+    for backend in (utils.orjson, None):
+        monkeypatch.setattr(utils, 'orjson', backend)
+        assert json.loads(utils.json_dumps(data)) == {'a': [1, 'ü', {'x': 2}]}
+        assert json.loads(utils.json_dumpb(data, indent=2)) == {'a': [1, 'ü', {'x': 2}]}
+        assert utils.json_dumps(data, indent=4, sort_keys=True) == json.dumps({'a': [1, 'ü', {'x': 2}]}, indent=4)